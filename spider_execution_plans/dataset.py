@@ -1,217 +1,562 @@
 """Create dataset of execution plans."""
 
+import argparse
+import asyncio
 import json
-import re
-import sys
+import time
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Callable, Optional, Sequence, Tuple
 
-import pandas as pd
-import pyodbc
-
-CONNECTION_STRING = (
-    "Driver={ODBC Driver 17 for SQL Server};"
-    f"Server={sys.argv[1]};"
-    "Database=spider;"
-    "Trusted_Connection=yes;"
+from .manifest import instance_hash, read_manifest, write_manifest
+from .plan_cache import PlanCache
+from .plan_sources import (
+    ALIAS_ERROR,
+    OdbcPlanSource,
+    PlanSource,
+    PlanSourceError,
+    ReplayPlanSource,
+    TransientPlanSourceError,
+    connection_string,
 )
+from .plan_writer import INDEX_KEY, PlanWriter, finalize, read_records
+from .query_rewriter import QueryRewriter
 
 SCHEMAS = [p.name for p in Path("schemas").glob("*") if p.name != ".git"]
 EXCLUDE = ["baseball_1", "college_2", "hr_1", "sakila_1", "soccer_1", "wta_1"]
-AFTER_FROM_KEYWORDS = ["where", "order", "group"]
 SPIDER_PATH = Path("C:/Users/beney/Desktop/spider")
 SPIDER_TRAIN = SPIDER_PATH / "train_spider.json"
 SPIDER_DEV = SPIDER_PATH / "dev.json"
 SPIDER_TABLES = SPIDER_PATH / "tables.json"
+PLAN_CACHE = "plan_cache.sqlite3"
+SPLITS = {"train": SPIDER_TRAIN, "dev": SPIDER_DEV}
+RETRIES = 3
+RETRY_BACKOFF = 0.1
+
+
+@dataclass
+class StageStats:
+    """The work of one harvest pipeline stage, for tuning its concurrency.
+
+    `busy` adds up the seconds spent working in all of the stage's tasks and
+    `waiting` the seconds they spent blocked on a full or empty queue.
+    """
+
+    name: str
+    items: int = 0
+    busy: float = 0.0
+    waiting: float = 0.0
+
+    def __str__(self) -> str:
+        rate = self.items / self.busy if self.busy else 0.0
+        return (
+            f"{self.name}: {self.items} in {self.busy:.2f}s busy ({rate:.0f}/s), "
+            f"{self.waiting:.2f}s waiting"
+        )
+
+
+@dataclass
+class DatabaseStats:
+    """The harvest of the instances of one database, timed on its fetch task.
+
+    `duplicates` are the instances whose query was already fetched or failed
+    in this run, which are neither looked up in the plan cache nor sent.
+    """
+
+    db_id: str
+    instances: int = 0
+    duplicates: int = 0
+    queries: int = 0
+    seconds: float = 0.0
 
 
 def add_execution_plan(
-    split: list, tables: dict, cursor: pyodbc.Cursor
-) -> Tuple[list, list]:
-    instances = []
+    split: list,
+    rewriter: QueryRewriter,
+    sources: Sequence[PlanSource],
+    cache: PlanCache,
+    writer: PlanWriter,
+    manifest: Optional[dict[int, str]] = None,
+    incremental: bool = False,
+    queue_size: Optional[int] = None,
+    batch_size: int = 1,
+    timings: Optional[dict[str, DatabaseStats]] = None,
+) -> list:
+    """Harvests the instances of `split` that `writer` does not hold yet.
+
+    Every harvested instance gets its hash in `manifest`. With
+    `incremental=True`, instances whose hash differs from the manifest are
+    harvested again, and `finalize` keeps their latest record. Instances
+    that fail, are no longer in the split or are excluded are removed from
+    `manifest`, so that `finalize` leaves their old records out. Instances
+    that `writer` holds but `manifest` does not, such as those harvested
+    before a crash, are added back when their record matches the split.
+
+    The split goes through a pipeline of asyncio tasks. Its instances are
+    rewritten one database at a time, and the queries of a database that are
+    not cached go to a queue of `queue_size` databases, by default two per
+    source. One task per source takes a whole database at a time and fetches
+    its plans in a thread, so the connection keeps the server caches of that
+    database warm. With `batch_size` above 1, up to that many queries are sent
+    in one round trip with `PlanSource.get_plans`. The results are written as
+    they arrive. `finalize` restores the split order, and the errors are
+    returned in split order. Each database gets its `DatabaseStats` in `timings`.
+    """
+    if manifest is None:
+        manifest = {}
+    recover_manifest(split, writer, manifest)
+    for idx in list(manifest):
+        if idx >= len(split) or split[idx]["db_id"] in EXCLUDE:
+            del manifest[idx]
+    if timings is None:
+        timings = {}
+    return asyncio.run(
+        _harvest_split(
+            split,
+            rewriter,
+            sources,
+            cache,
+            writer,
+            manifest,
+            incremental,
+            queue_size or 2 * len(sources),
+            batch_size,
+            timings,
+        )
+    )
+
+
+def recover_manifest(split: list, writer: PlanWriter, manifest: dict[int, str]) -> None:
+    """Adds the hash of every instance of `split` that `writer` holds but `manifest`
+    does not, if its latest record is of the instance as it is now.
+
+    The manifest is written when a split ends, so after a crash it lacks the
+    instances harvested since, and a JSON Lines file from before manifests
+    has none at all.
+    """
+    missing = {idx for idx in writer.harvested if idx not in manifest and idx < len(split)}
+    if not missing:
+        return
+    recorded = {}
+    for record in read_records(writer.path):
+        idx = record.pop(INDEX_KEY)
+        if idx in missing:
+            del record["ep"]
+            recorded[idx] = instance_hash(record)
+    for idx, content_hash in recorded.items():
+        if content_hash == instance_hash(split[idx]):
+            manifest[idx] = content_hash
+
+
+async def _harvest_split(
+    split: list,
+    rewriter: QueryRewriter,
+    sources: Sequence[PlanSource],
+    cache: PlanCache,
+    writer: PlanWriter,
+    manifest: dict[int, str],
+    incremental: bool,
+    queue_size: int,
+    batch_size: int,
+    timings: dict[str, DatabaseStats],
+) -> list:
+    loop = asyncio.get_running_loop()
+    # Databases with the queries to fetch, and the instances waiting for each query.
+    fetches = asyncio.Queue(queue_size)
+    # Fetched or cached plans, with the instances they belong to.
+    results = asyncio.Queue(4 * queue_size * batch_size)
+    stats = {name: StageStats(name) for name in ("rewrite", "fetch", "write")}
     errors = []
-    for instance in split:
-        db_id = instance["db_id"]
-        if db_id in EXCLUDE:
-            continue
-        table = tables[db_id]
-        query_tokens = instance["query_toks"]
-        lowercase_query = instance["query"].lower()
-
-        if "group by" in lowercase_query:
-            query_tokens = copy_columns_from_select_to_groupby(query_tokens)
-        if "select distinct" in lowercase_query and "order by" in lowercase_query:
-            query_tokens = copy_orderby_to_select_distinct(query_tokens)
-        if "limit" in lowercase_query:
-            query_tokens = convert_limit_to_top(query_tokens)
-
-        query_tokens = ["'" if t in ("``", "''") else t for t in query_tokens]
-        query_tokens = add_schema_name_to_tables(db_id, query_tokens, table)
-        new_query = re.sub(r"' ([^']+) '", r"'\1'", " ".join(query_tokens))
-        new_query = re.sub(r'"([^"]+)"', r"'\1'", new_query)
-        print(f"{db_id}: {new_query}")
+    # Rewritten queries that already failed in this run, so that duplicates
+    # are not sent to the server again. Failures are not cached on disk.
+    failed = {}
+
+    async def rewrite() -> None:
+        stage = stats["rewrite"]
+        groups: dict[str, list[int]] = {}
+        for idx, instance in enumerate(split):
+            if instance["db_id"] not in EXCLUDE:
+                groups.setdefault(instance["db_id"], []).append(idx)
+        for db_id, indices in groups.items():
+            start = time.perf_counter()
+            queries: dict[str, list] = {}
+            ready = []
+            duplicates = 0
+            for idx in indices:
+                instance = split[idx]
+                content_hash = instance_hash(instance)
+                if (
+                    idx in writer.harvested
+                    and idx in manifest
+                    and (not incremental or manifest[idx] == content_hash)
+                ):
+                    continue
+                new_query = rewriter.rewrite(instance)
+                item = (idx, instance, content_hash)
+                stage.items += 1
+                if new_query in queries:
+                    queries[new_query].append(item)
+                    duplicates += 1
+                elif new_query in failed:
+                    ready.append(([item], new_query, failed[new_query], False))
+                    duplicates += 1
+                else:
+                    ep_xml = cache.get(new_query)
+                    if ep_xml is None:
+                        queries[new_query] = [item]
+                    else:
+                        ready.append(([item], new_query, (ep_xml, new_query, None), False))
+            if queries or ready:
+                timings[db_id] = DatabaseStats(
+                    db_id, len(ready) + sum(map(len, queries.values())), duplicates
+                )
+            stage.busy += time.perf_counter() - start
+            start = time.perf_counter()
+            if queries:
+                await fetches.put((db_id, queries))
+            for result in ready:
+                await results.put(result)
+            # Lets the other stages run between databases, even when no queue is full.
+            await asyncio.sleep(0)
+            stage.waiting += time.perf_counter() - start
+        for _ in sources:
+            await fetches.put(None)
+
+    async def fetch(source: PlanSource) -> None:
+        stage = stats["fetch"]
+        while True:
+            start = time.perf_counter()
+            job = await fetches.get()
+            stage.waiting += time.perf_counter() - start
+            if job is None:
+                return
+            db_id, queries = job
+            pending = list(queries)
+            db_start = time.perf_counter()
+            for i in range(0, len(pending), batch_size):
+                batch = pending[i : i + batch_size]
+                for new_query in batch:
+                    print(f"{db_id}: {new_query}")
+                start = time.perf_counter()
+                fetched = await loop.run_in_executor(executor, fetch_plans, batch, source)
+                stage.items += len(batch)
+                stage.busy += time.perf_counter() - start
+                for new_query, fetched_plan in zip(batch, fetched):
+                    await results.put((queries[new_query], new_query, fetched_plan, True))
+            timings[db_id].queries += len(pending)
+            timings[db_id].seconds += time.perf_counter() - db_start
+
+    async def produce() -> None:
+        await asyncio.gather(rewrite(), *(fetch(source) for source in sources))
+        await results.put(None)
+
+    async def write() -> None:
+        stage = stats["write"]
+        while True:
+            start = time.perf_counter()
+            result = await results.get()
+            stage.waiting += time.perf_counter() - start
+            if result is None:
+                return
+            start = time.perf_counter()
+            items, new_query, (ep_xml, sent_query, error), fresh = result
+            if error is not None:
+                failed[new_query] = (None, sent_query, error)
+                for idx, instance, _ in items:
+                    manifest.pop(idx, None)
+                    row = {"db_id": instance["db_id"], "query": sent_query, "error": error}
+                    errors.append((idx, row))
+                continue
+            if fresh:
+                cache.put(new_query, ep_xml)
+            for idx, instance, content_hash in items:
+                writer.write(idx, {**instance, "ep": ep_xml})
+                manifest[idx] = content_hash
+            stage.items += len(items)
+            stage.busy += time.perf_counter() - start
+
+    executor = ThreadPoolExecutor(len(sources))
+    tasks = [asyncio.create_task(produce()), asyncio.create_task(write())]
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # On an error or a cancellation, stop every stage; what was written stays written.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        executor.shutdown(wait=True, cancel_futures=True)
+    elapsed = time.perf_counter() - start
+    print(f"Harvested {stats['write'].items} instances in {elapsed:.1f}s")
+    for stage in stats.values():
+        print(f"  {stage}")
+    errors.sort(key=lambda error: error[0])
+    return [error for _, error in errors]
+
+
+FetchedPlan = Tuple[Optional[str], str, Optional[PlanSourceError]]
+
+
+def fetch_plans(queries: list[str], source: PlanSource) -> list[FetchedPlan]:
+    """Fetches the plans of several queries in one round trip.
+
+    If the batch fails, the queries are sent one at a time, so that every
+    error is attributed to its query and the alias hack still applies.
+    """
+    if len(queries) > 1:
         try:
-            ep_xml = cursor.execute(new_query).fetchone()[0]
-            instance["ep"] = ep_xml
-            instances.append(instance)
-        except pyodbc.ProgrammingError as e:
-            # This is a hack.
-            # There are several cases of SELECT ... FROM (SELECT ... )
-            # This doesn't work in SQL Server, unless the FROM gets an alias,
-            # so I artificially add an alias at the end of the query.
-            if "Incorrect syntax near ')'." in e.args[1]:
-                new_query = new_query + " AS T10"
-                try:
-                    ep_xml = cursor.execute(new_query).fetchone()[0]
-                    instance["ep"] = ep_xml
-                    instances.append(instance)
-                except pyodbc.ProgrammingError as e:
-                    errors.append({"db_id": db_id, "query": new_query, "error": e})
-            else:
-                errors.append({"db_id": db_id, "query": new_query, "error": e})
-    return instances, errors
-
-
-def copy_orderby_to_select_distinct(query_tokens):
-    lowercase_query_tokens = [t.lower() for t in query_tokens]
-    order_idx = lowercase_query_tokens.index("order")
-    for i in range(order_idx, -1, -1):
-        if lowercase_query_tokens[i] == "distinct":
-            distinct_idx = i
-            break
-    if lowercase_query_tokens[order_idx + 2] in ("sum", "avg", "count", "min", "max"):
-        orderby_arg = query_tokens[
-            order_idx + 2 : lowercase_query_tokens.index(")", order_idx + 2)
-        ]
-    else:
-        orderby_arg = query_tokens[order_idx + 2]
-    from_idx = lowercase_query_tokens.index("from")
-    select_args = query_tokens[distinct_idx + 1 : from_idx]
-    if type(orderby_arg) == list:
-        query_tokens = (
-            query_tokens[: distinct_idx + 1]
-            + orderby_arg
-            + [","]
-            + query_tokens[distinct_idx + 1 :]
-        )
-    elif orderby_arg not in select_args:
-        query_tokens = (
-            query_tokens[: distinct_idx + 1]
-            + [orderby_arg, ","]
-            + query_tokens[distinct_idx + 1 :]
-        )
-    return query_tokens
-
-
-def copy_columns_from_select_to_groupby(query_tokens):
-    lowercase_query_tokens = [t.lower() for t in query_tokens]
-    new_query_tokens = []
-    i = 0
-    while i < len(query_tokens):
-        if lowercase_query_tokens[i] == "select":
-            if lowercase_query_tokens[i + 1] == "distinct":
-                select_idx = i + 1
-                new_query_tokens.extend(query_tokens[i : i + 2])
-                i += 2
+            plans = with_retries(source.get_plans, queries)
+            return [(plan, query, None) for plan, query in zip(plans, queries)]
+        except PlanSourceError:
+            pass
+    return [fetch_plan(query, source) for query in queries]
+
+
+def fetch_plan(query: str, source: PlanSource) -> FetchedPlan:
+    """Returns the plan XML, the query that was last sent and the error, if any."""
+    try:
+        return get_plan(query, source), query, None
+    except PlanSourceError as e:
+        # This is a hack.
+        # There are several cases of SELECT ... FROM (SELECT ... )
+        # This doesn't work in SQL Server, unless the FROM gets an alias,
+        # so I artificially add an alias at the end of the query.
+        if ALIAS_ERROR in str(e):
+            query = query + " AS T10"
+            try:
+                return get_plan(query, source), query, None
+            except PlanSourceError as e:
+                return None, query, e
+        return None, query, e
+
+
+def get_plan(query: str, source: PlanSource) -> str:
+    return with_retries(source.get_plan, query)
+
+
+def with_retries(fetch: Callable, *args) -> Any:
+    """Retries transient failures with exponential backoff."""
+    for attempt in range(RETRIES):
+        try:
+            return fetch(*args)
+        except TransientPlanSourceError:
+            time.sleep(RETRY_BACKOFF * 2**attempt)
+    return fetch(*args)
+
+
+def harvested_paths(split_name: str) -> Tuple[Path, Path]:
+    """Returns the streaming JSON Lines path and the legacy JSON path of a split."""
+    stem = Path("dataset") / f"{split_name}_spider_with_ep"
+    return stem.with_suffix(".jsonl"), stem.with_suffix(".json")
+
+
+def manifest_path(split_name: str) -> Path:
+    return Path("dataset") / f"{split_name}_manifest.json"
+
+
+def write_split_shards(split_name: str, json_path: Path, codec: Optional[str]) -> None:
+    """Shards a finalized split with `codec`, or keeps existing shards up to date."""
+    from .execution_plans.ep_reader import shards_dir
+    from .execution_plans.ep_shards import MANIFEST, read_manifest, write_shards
+
+    directory = Path(shards_dir(split_name))
+    if codec is None:
+        if not (directory / MANIFEST).exists():
+            return
+        codec = read_manifest(directory)["codec"]
+    with open(json_path, encoding="utf-8") as f:
+        manifest = write_shards(json.load(f), directory, codec)
+    print(f"Wrote {len(manifest['shards'])} {codec} shards to {directory}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("server", nargs="?", help="SQL Server instance to connect to")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="keep the instances harvested by a previous run and skip them",
+    )
+    parser.add_argument(
+        "--finalize",
+        action="store_true",
+        help="only write the legacy JSON files from the harvested JSON Lines files",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="like --resume, but also harvest again the instances that changed "
+        "since the last run, according to the split manifests",
+    )
+    parser.add_argument("--checkpoint-every", type=int, default=100)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="number of queries sent to the server in one batch",
+    )
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=1,
+        help="number of plans fetched concurrently, each over its own connection",
+    )
+    parser.add_argument("--plan-cache", default=PLAN_CACHE)
+    parser.add_argument(
+        "--shards",
+        choices=["lzma", "gzip", "bz2"],
+        help="also write the finalized splits as ep_shards with this codec; "
+        "splits that are already sharded are rewritten with their codec anyway",
+    )
+    parser.add_argument(
+        "--plan-store",
+        help="bring this ep_store SQLite file up to date with the finalized splits",
+    )
+    replay = parser.add_argument_group(
+        "replay", "serve recorded plans instead of connecting to a server"
+    )
+    replay.add_argument(
+        "--replay",
+        nargs="+",
+        type=Path,
+        metavar="PATH",
+        help="a plan cache, or harvested .json/.jsonl files",
+    )
+    replay.add_argument("--latency", type=float, default=0.0)
+    replay.add_argument("--jitter", type=float, default=0.0)
+    replay.add_argument("--error-rate", type=float, default=0.0)
+    replay.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if not args.finalize:
+        with ExitStack() as stack:
+            if args.replay:
+                replay_args = {
+                    "latency": args.latency,
+                    "jitter": args.jitter,
+                    "error_rate": args.error_rate,
+                    "seed": args.seed,
+                }
+                if args.replay[0].suffix in (".json", ".jsonl"):
+                    source = ReplayPlanSource.from_dataset(args.replay, **replay_args)
+                else:
+                    with PlanCache(str(args.replay[0])) as recorded:
+                        source = ReplayPlanSource.from_cache(recorded, **replay_args)
+                # Replay sources are thread-safe and are shared by all connections.
+                sources = [stack.enter_context(source)] * args.connections
+            elif args.server is not None:
+                sources = [
+                    stack.enter_context(OdbcPlanSource(connection_string(args.server)))
+                    for _ in range(args.connections)
+                ]
             else:
-                select_idx = i
-                new_query_tokens.append(query_tokens[i])
-                i += 1
-        elif lowercase_query_tokens[i] == "from":
-            select_args = [t for t in query_tokens[select_idx + 1 : i] if t != ","]
-            lowercase_select_args = [t.lower() for t in select_args]
-            for agg in ("sum", "avg", "count", "min", "max"):
-                while agg in lowercase_select_args:
-                    idx = lowercase_select_args.index(agg)
-                    del select_args[idx : lowercase_select_args.index(")", idx) + 1]
-                    lowercase_select_args = [t.lower() for t in select_args]
-            new_query_tokens.append(query_tokens[i])
-            i += 1
-        elif (
-            lowercase_query_tokens[i] == "group"
-            and lowercase_query_tokens[i + 1] == "by"
-        ):
-            groupby_arg = query_tokens[i + 2]
-            if groupby_arg not in select_args:
-                select_args.append(groupby_arg)
-            new_query_tokens.extend(query_tokens[i : i + 2])
-            new_query_tokens.extend(" , ".join(select_args).split())
-            i += 3
-        else:
-            new_query_tokens.append(query_tokens[i])
-            i += 1
-    return new_query_tokens
-
-
-def add_schema_name_to_tables(db_id, query_tokens, table):
-    new_query_tokens = []
-    lowercase_table_names = [t.lower() for t in table["table_names_original"]]
-    is_from = False
-    for token in query_tokens:
-        lower = token.lower()
-        if lower == "from":
-            is_from = True
-        if is_from and lower in lowercase_table_names:
-            new_query_tokens.append(f"{db_id}.{token}")
-        else:
-            new_query_tokens.append(token)
-        if lower in AFTER_FROM_KEYWORDS:
-            is_from = False
-    return new_query_tokens
-
-
-def convert_limit_to_top(query_tokens):
-    lowercase_query_tokens = [t.lower() for t in query_tokens]
-    while "limit" in lowercase_query_tokens:
-        limit_idx = lowercase_query_tokens.index("limit")
-        limit_arg = lowercase_query_tokens[limit_idx + 1]
-        del query_tokens[limit_idx : limit_idx + 2]
-        for i in range(limit_idx, -1, -1):
-            if lowercase_query_tokens[i] == "select":
-                select_idx = i
-                break
-        top = ["TOP", str(limit_arg)]
-        if "distinct" in lowercase_query_tokens[select_idx:]:
-            distinct_idx = lowercase_query_tokens.index("distinct")
-            query_tokens = (
-                query_tokens[: distinct_idx + 1]
-                + top
-                + query_tokens[distinct_idx + 1 :]
+                parser.error("a server or --replay is required unless --finalize is given")
+            harvest(
+                sources,
+                args.plan_cache,
+                args.resume,
+                args.checkpoint_every,
+                args.incremental,
+                args.batch_size,
             )
+
+    for split_name in SPLITS:
+        jsonl_path, json_path = harvested_paths(split_name)
+        if jsonl_path.exists():
+            # Only the instances in the manifest are current, if there is one.
+            indices = None
+            if manifest_path(split_name).exists():
+                indices = read_manifest(manifest_path(split_name))
+            count = finalize(jsonl_path, json_path, indices)
+            print(f"Wrote {count} instances to {json_path}")
+        elif json_path.exists():
+            # A checkout with only the legacy JSON: it is kept as it is.
+            print(f"No {jsonl_path}; keeping the existing {json_path}")
         else:
-            query_tokens = (
-                query_tokens[: select_idx + 1] + top + query_tokens[select_idx + 1 :]
-            )
-        lowercase_query_tokens = [t.lower() for t in query_tokens]
-    return query_tokens
+            print(f"No {jsonl_path} or {json_path}; skipping {split_name}")
+            continue
+        write_split_shards(split_name, json_path, args.shards)
 
+    if args.plan_store:
+        from .execution_plans.ep_reader import source_path
+        from .execution_plans.ep_store import PlanStore
 
-def main() -> None:
+        with PlanStore(args.plan_store) as store:
+            for split_name in SPLITS:
+                if not Path(source_path(split_name)).exists():
+                    continue
+                added, removed = store.sync_split(split_name)
+                print(
+                    f"Plan store: {added} {split_name} instances added or updated, "
+                    f"{removed} removed"
+                )
+
+    print("Done!")
+
+
+def harvest(
+    sources: Sequence[PlanSource],
+    plan_cache: str,
+    resume: bool,
+    checkpoint_every: int,
+    incremental: bool = False,
+    batch_size: int = 1,
+) -> None:
     with open(SPIDER_TABLES, mode="r", encoding="utf-8") as f:
         tables = json.load(f)
-        tables = {table["db_id"]: table for table in tables}
-    with open(SPIDER_TRAIN, mode="r", encoding="utf-8") as f:
-        train = json.load(f)
-    with open(SPIDER_DEV, mode="r", encoding="utf-8") as f:
-        dev = json.load(f)
+        rewriter = QueryRewriter({table["db_id"]: table for table in tables})
 
-    connection = pyodbc.connect(CONNECTION_STRING)
-    cursor = connection.cursor()
-    cursor.execute("SET SHOWPLAN_XML ON")
+    errors = []
+    timings = []
+    with PlanCache(plan_cache) as cache:
+        for split_name, split_path in SPLITS.items():
+            with open(split_path, mode="r", encoding="utf-8") as f:
+                split = json.load(f)
+            jsonl_path, _ = harvested_paths(split_name)
+            resume_split = resume or incremental
+            manifest = read_manifest(manifest_path(split_name)) if resume_split else {}
+            split_timings: dict[str, DatabaseStats] = {}
+            with PlanWriter(jsonl_path, resume_split, checkpoint_every) as writer:
+                try:
+                    errors += add_execution_plan(
+                        split,
+                        rewriter,
+                        sources,
+                        cache,
+                        writer,
+                        manifest,
+                        incremental,
+                        batch_size=batch_size,
+                        timings=split_timings,
+                    )
+                finally:
+                    write_manifest(manifest_path(split_name), manifest)
+            slowest = sorted(split_timings.values(), key=lambda t: -t.seconds)[:5]
+            print(f"Slowest {split_name} databases:")
+            for t in slowest:
+                print(f"  {t.db_id}: {t.queries} queries in {t.seconds:.1f}s")
+            timings += [{"split": split_name, **asdict(t)} for t in split_timings.values()]
+        lookups = cache.hits + cache.misses
+        duplicates = sum(t["duplicates"] for t in timings)
+        print(
+            f"Plan cache: {cache.hits}/{lookups} hits "
+            f"({cache.hits / max(lookups, 1):.1%}), {cache.misses} queries sent"
+        )
+        # Queries already fetched or failed in this run never reach the cache.
+        queries = lookups + duplicates
+        print(
+            f"Repeated queries: {duplicates}, so {queries - cache.misses}/{queries} "
+            f"queries were not sent ({1 - cache.misses / max(queries, 1):.1%})"
+        )
 
-    new_train, errors_1 = add_execution_plan(train, tables, cursor)
-    new_dev, errors_2 = add_execution_plan(dev, tables, cursor)
+    import pandas as pd
 
-    errors_df = pd.DataFrame(data=errors_1 + errors_2)
+    errors_df = pd.DataFrame(data=errors)
     errors_df.to_csv("errors.csv", index=False)
-
-    with open("dataset/train_spider_with_ep.json", mode="w", encoding="utf-8") as f:
-        json.dump(new_train, f, indent=2)
-    with open("dataset/dev_spider_with_ep.json", mode="w", encoding="utf-8") as f:
-        json.dump(new_dev, f, indent=2)
-
-    print("Done!")
+    pd.DataFrame(data=timings).to_csv("db_timings.csv", index=False)
 
 
 if __name__ == "__main__":
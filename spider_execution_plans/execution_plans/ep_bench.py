@@ -0,0 +1,269 @@
+"""Throughput and peak memory of reading, parsing, searching and rendering plans.
+
+The benchmarks run on a synthetic corpus from `ep_synth` that is written to a
+temporary directory `ep_reader` is pointed at, so the Spider dataset is not
+needed. Results are written as JSON and can be compared with an earlier run:
+
+    python -m spider_execution_plans.execution_plans.ep_bench --output baseline.json
+    python -m spider_execution_plans.execution_plans.ep_bench --baseline baseline.json
+
+Each benchmark is timed `--repeat` times and the fastest run is kept. Peak
+memory is measured in one more run under `tracemalloc`, which is not timed.
+"""
+
+import argparse
+import gc
+import json
+import os
+import pickle
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator, Sequence, Tuple
+
+from lxml import etree
+
+from . import ep_codec, ep_reader, ep_shards
+from .ep_parser import parse
+from .ep_search import query, query_all
+from .ep_synth import generate, write_dataset
+from .ep_types import ExecutionPlan, IndexScan
+from .plan_to_graph import build_execution_plan_graph
+from .plan_to_text import UnsupportedPlanError, plan_to_text
+
+BENCHMARKS = (
+    "read",
+    "read_shards",
+    "parse",
+    "parse_lazy",
+    "json_encode",
+    "json_decode",
+    "pickle",
+    "query",
+    "query_all",
+    "plan_to_text",
+    "dot",
+)
+
+# A benchmark returns the number of plans it processed and how many of them failed.
+Benchmark = Callable[[], Tuple[int, int]]
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    plans: int
+    seconds: float
+    plans_per_second: float
+    peak_bytes: int
+    errors: int
+
+
+@contextmanager
+def synthetic_dataset(train: list[dict], dev: list[dict]) -> Iterator[None]:
+    previous = ep_reader.DATASET_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        ep_reader.DATASET_DIR = tmp
+        try:
+            write_dataset(train, ep_reader.dataset_path("train"))
+            write_dataset(dev, ep_reader.dataset_path("dev"))
+            yield
+        finally:
+            ep_reader.DATASET_DIR = previous
+
+
+def benchmarks(xmls: Sequence[str], eps: Sequence[ExecutionPlan]) -> dict[str, Benchmark]:
+    def read():
+        return len(ep_reader.read("train")) + len(ep_reader.read("dev")), 0
+
+    # Apart from the shards of ep_reader, which it would read instead of the JSON.
+    shard_dirs = [f"{ep_reader.DATASET_DIR}/shards/{split}" for split in ("train", "dev")]
+    for split, directory in zip(("train", "dev"), shard_dirs):
+        ep_shards.write_shards(ep_reader.read(split), directory)
+
+    def read_shards():
+        return sum(len(ep_shards.read_shards(d)) for d in shard_dirs), 0
+
+    def parse_eager():
+        return len([parse(etree.fromstring(x)) for x in xmls]), 0
+
+    def parse_lazy():
+        return len([parse(etree.fromstring(x), lazy=True) for x in xmls]), 0
+
+    blobs = [ep_codec.dumps(ep) for ep in eps]
+
+    def json_encode():
+        return len([ep_codec.dumps(ep) for ep in eps]), 0
+
+    def json_decode():
+        return len([ep_codec.loads(b) for b in blobs]), 0
+
+    def pickle_():
+        return len([pickle.loads(pickle.dumps(ep, protocol=5)) for ep in eps]), 0
+
+    def query_():
+        for ep in eps:
+            query(ep, IndexScan)
+        return len(eps), 0
+
+    def query_all_():
+        query_all(IndexScan)
+        return len(eps), 0
+
+    # plan_to_text prints its environment, and does not support every operator.
+    # Only the plans it supports are timed; the others are reported as errors.
+    # Any other error is a bug and is raised.
+    renderable = []
+    with open(os.devnull, mode="w") as devnull, redirect_stdout(devnull):
+        for ep in eps:
+            try:
+                plan_to_text(ep)
+                renderable.append(ep)
+            except UnsupportedPlanError:
+                pass
+    unsupported = len(eps) - len(renderable)
+
+    def text():
+        with open(os.devnull, mode="w") as devnull, redirect_stdout(devnull):
+            for ep in renderable:
+                plan_to_text(ep)
+        return len(renderable), unsupported
+
+    def dot():
+        for ep in eps:
+            build_execution_plan_graph(ep).source
+        return len(eps), 0
+
+    return {
+        "read": read,
+        "read_shards": read_shards,
+        "parse": parse_eager,
+        "parse_lazy": parse_lazy,
+        "json_encode": json_encode,
+        "json_decode": json_decode,
+        "pickle": pickle_,
+        "query": query_,
+        "query_all": query_all_,
+        "plan_to_text": text,
+        "dot": dot,
+    }
+
+
+def measure(benchmark: Benchmark, repeat: int) -> BenchmarkResult:
+    seconds = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        plans, errors = benchmark()
+        seconds = min(seconds, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        benchmark()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return BenchmarkResult(plans, seconds, plans / seconds, peak_bytes, errors)
+
+
+def run(
+    plans: int = 2000,
+    depth: int = 8,
+    seed: int = 0,
+    repeat: int = 3,
+    names: Sequence[str] = BENCHMARKS,
+) -> dict:
+    """Runs the benchmarks on `plans` train and `plans // 5` dev plans."""
+    train = generate(plans, depth, seed)
+    dev = generate(plans // 5, depth, seed + 1)
+    xmls = [ins["ep"] for ins in train + dev]
+    eps = [parse(etree.fromstring(x)) for x in xmls]
+    results = {}
+    with synthetic_dataset(train, dev):
+        suite = benchmarks(xmls, eps)
+        for name in names:
+            results[name] = asdict(measure(suite[name], repeat))
+            result = results[name]
+            failed = (
+                f", {result['errors']} of {result['plans'] + result['errors']} plans failed"
+                if result["errors"]
+                else ""
+            )
+            rate = result["plans_per_second"]
+            print(f"{name}: {rate:.0f} plans/s{failed}", file=sys.stderr)
+    return {
+        "config": {"plans": plans, "depth": depth, "seed": seed, "repeat": repeat},
+        "environment": {
+            "python": platform.python_version(),
+            "lxml": ".".join(map(str, etree.LXML_VERSION)),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.1) -> list[str]:
+    """Prints the change from `baseline` and returns the benchmarks that regressed.
+
+    A benchmark regresses when its throughput drops or its peak memory grows by
+    more than `tolerance`, or when more plans fail than in the baseline.
+    """
+    if report["config"] != baseline["config"]:
+        print(f"Warning: the baseline was run with {baseline['config']}.")
+    print(
+        f"{'':<14} {'plans/s':>10} {'baseline':>10} {'ratio':>6} "
+        f"{'peak MB':>9} {'baseline':>9} {'ratio':>6}"
+    )
+    regressions = []
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        base = baseline["results"][name]
+        speed = result["plans_per_second"] / base["plans_per_second"]
+        memory = result["peak_bytes"] / max(base["peak_bytes"], 1)
+        regressed = (
+            speed < 1 - tolerance
+            or memory > 1 + tolerance
+            or result["errors"] > base["errors"]
+        )
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<14} {result['plans_per_second']:>10.0f} {base['plans_per_second']:>10.0f} "
+            f"{speed:>6.2f} {result['peak_bytes'] / 2**20:>9.1f} {base['peak_bytes'] / 2**20:>9.1f} "
+            f"{memory:>6.2f}{'  REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=2000, help="Number of train plans.")
+    parser.add_argument("--depth", type=int, default=8, help="RelOp levels per plan.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with the results in this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    report = run(args.plans, args.depth, args.seed, args.repeat, args.benchmarks)
+    if args.output:
+        with open(args.output, mode="w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
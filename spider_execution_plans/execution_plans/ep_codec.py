@@ -0,0 +1,168 @@
+"""JSON codecs for parsed execution plans.
+
+Every `ep_types` object becomes a JSON object tagged with its class name under
+`TAG`, with one key per field that differs from the field's default:
+
+    {"_": "Identifier", "column_reference": {"_": "ColumnReference", "column": "[id]"}}
+
+Lists are JSON lists and the other values are JSON scalars, so plans can be
+read by any JSON consumer. `to_dict`/`from_dict` convert to and from the
+plain Python values and `dumps`/`loads` to and from UTF-8 JSON bytes. Both
+directions are iterative, so plan depth is not limited by the recursion limit,
+and lazily parsed plans encode like their eager counterparts.
+"""
+
+import gc
+import json
+import threading
+
+from dataclasses import MISSING, fields, is_dataclass
+from typing import Any, Callable, Union
+
+from . import ep_types
+from .ep_types import ExecutionPlan
+
+TAG = "_"
+
+CLASSES = {
+    name: value
+    for name, value in vars(ep_types).items()
+    if isinstance(value, type) and is_dataclass(value)
+}
+# The fields of each class as (name, default) pairs, where a default of `[]`
+# stands for `default_factory=list` and `MISSING` for a required field.
+FIELDS = {
+    cls: tuple(
+        (f.name, [] if f.default_factory is list else f.default) for f in fields(cls)
+    )
+    for cls in CLASSES.values()
+}
+# The values decoding starts from: defaults, and the fields needing a new list.
+DEFAULTS = {
+    name: (
+        cls,
+        {n: d for n, d in FIELDS[cls] if d is not MISSING and d != []},
+        tuple(n for n, d in FIELDS[cls] if d == []),
+    )
+    for name, cls in CLASSES.items()
+}
+
+
+def class_fields(cls: type) -> tuple:
+    """The fields of `cls`, or of the `ep_types` class a lazy operation derives from."""
+    for base in cls.__mro__:
+        if base in FIELDS:
+            FIELDS[cls] = FIELDS[base]
+            return FIELDS[cls]
+    raise ValueError(f"Cannot encode objects of type {cls.__name__}.")
+
+
+def to_dict(ep: Any) -> dict:
+    """The tagged representation of an `ExecutionPlan` or any other `ep_types` object."""
+    root = [ep]
+    stack = [(root, 0)]
+    while stack:
+        container, key = stack.pop()
+        value = container[key]
+        if isinstance(value, list):
+            encoded = container[key] = value.copy()
+            stack.extend((encoded, i) for i in range(len(encoded)))
+            continue
+        cls = type(value)
+        if cls in (str, int, float, bool) or value is None:
+            continue
+        spec = FIELDS.get(cls) or class_fields(cls)
+        encoded = container[key] = {TAG: cls.__name__}
+        for name, default in spec:
+            v = getattr(value, name)
+            if v is default or (default == [] and v == []):
+                continue
+            encoded[name] = v
+            if not (v is None or type(v) in (str, int, float, bool)):
+                stack.append((encoded, name))
+    return root[0]
+
+
+def _object_hook(data: dict) -> Any:
+    try:
+        cls, defaults, lists = DEFAULTS[data.pop(TAG)]
+    except KeyError:
+        raise ValueError(f"Object without a known {TAG!r} tag: {data}")
+    obj = cls.__new__(cls)
+    # The classes are frozen; fill in the instance dictionary like unpickling does.
+    state = obj.__dict__
+    state.update(defaults)
+    for name in lists:
+        state[name] = []
+    state.update(data)
+    return obj
+
+
+def from_dict(data: Union[dict, list]) -> Any:
+    """The object a `to_dict` representation stands for. `data` is not modified."""
+    root = [data]
+    # (container, key, whether its children have been decoded), children first.
+    stack = [(root, 0, False)]
+    without_gc(_decode, stack)
+    return root[0]
+
+
+def _loads(data: Union[bytes, str]) -> Any:
+    return json.loads(data, object_hook=_object_hook)
+
+
+def _decode(stack: list) -> None:
+    while stack:
+        container, key, decoded = stack.pop()
+        if decoded:
+            container[key] = _object_hook(container[key])
+            continue
+        value = container[key]
+        if isinstance(value, dict):
+            value = container[key] = value.copy()
+            stack.append((container, key, True))
+            children = value.items()
+        elif isinstance(value, list):
+            value = container[key] = value.copy()
+            children = enumerate(value)
+        else:
+            continue
+        stack.extend((value, k, False) for k, v in children if isinstance(v, (dict, list)))
+
+
+_gc_lock = threading.Lock()
+_gc_pauses = 0
+_gc_was_enabled = False
+
+
+def without_gc(fn: Callable, *args) -> Any:
+    """Calls `fn(*args)` with cyclic garbage collection paused.
+
+    Decoding allocates many small acyclic objects, which would otherwise
+    trigger collections that take longer than the decoding. Pauses in several
+    threads overlap, and collection resumes when the last of them ends.
+    """
+    # No `with` statements: the objects they allocate can trigger a collection.
+    global _gc_pauses, _gc_was_enabled
+    _gc_lock.acquire()
+    if _gc_pauses == 0:
+        _gc_was_enabled = gc.isenabled()
+        gc.disable()
+    _gc_pauses += 1
+    _gc_lock.release()
+    try:
+        return fn(*args)
+    finally:
+        _gc_lock.acquire()
+        _gc_pauses -= 1
+        if _gc_pauses == 0 and _gc_was_enabled:
+            gc.enable()
+        _gc_lock.release()
+
+
+def dumps(ep: Any) -> bytes:
+    return json.dumps(to_dict(ep), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data: Union[bytes, str]) -> ExecutionPlan:
+    return without_gc(_loads, data)
@@ -0,0 +1,293 @@
+"""A read-only, memory-mapped corpus of parsed plans for multi-process workers.
+
+`write_corpus` stores plans once, in the flat pre-order encoding of
+`ep_pickle` laid out for random access, and `PlanCorpus` maps the file.
+Workers walk the plans through `NodeView`s and `ListView`s, which read
+fields straight from the mapping. The corpus pages are shared through the page
+cache and are never written, so every process reuses the same physical memory
+however many workers there are:
+
+    write_corpus(get_eps("train"), "train.corpus")
+    corpus = PlanCorpus("train.corpus")
+    corpus[0].relop.operation.type_name  # e.g. "NestedLoops"
+    corpus.plan(0)  # the ExecutionPlan itself
+
+Each value of a plan is one token, with parallel arrays of:
+
+- `codes` (uint8): its kind, as in `ep_pickle`, with class ids global to the corpus
+- `values` (int64): the int, the string id, the float index or the list length
+- `ends` (int64): the position after the value, so fields can be skipped
+"""
+
+import json
+import mmap
+
+from array import array
+from typing import Any, Iterable, Iterator, Literal
+
+from .ep_codec import CLASSES
+from .ep_pickle import FIELD_NAMES, FLOAT, INT, LIST, OBJECT, STR, _unflatten, flatten
+from .ep_types import ExecutionPlan
+
+MAGIC = b"EPCORPUS"
+CLASS_NAMES = tuple(sorted(CLASSES))
+CLASS_IDS = {name: i for i, name in enumerate(CLASS_NAMES)}
+FIELD_INDEX = {
+    name: {f: i for i, f in enumerate(FIELD_NAMES[name][1])} for name in CLASS_NAMES
+}
+# The sections of a corpus file, in order, with their array typecodes.
+SECTIONS = (
+    ("plans", "q"),
+    ("codes", "B"),
+    ("values", "q"),
+    ("ends", "q"),
+    ("floats", "d"),
+    ("string_offsets", "q"),
+    ("strings", "B"),
+)
+
+
+class CorpusWriter:
+    def __init__(self):
+        self.plans = array("q", [0])
+        self.codes = array("B")
+        self.values = array("q")
+        self.ends = array("q")
+        self.floats = array("d")
+        self.string_ids: dict[str, int] = {}
+
+    def add(self, ep: ExecutionPlan) -> None:
+        classes, strings, _, codes, payload, floats = flatten(ep)
+        class_ids = [CLASS_IDS[name] for name in classes]
+        n_fields = [len(FIELD_NAMES[name][1]) for name in classes]
+        payload = iter(payload)
+        floats = iter(floats)
+        # Objects and lists being written, as [position, missing values].
+        stack = []
+        for code in codes:
+            position = len(self.codes)
+            self.ends.append(0)
+            if code >= OBJECT:
+                self.codes.append(OBJECT + class_ids[code - OBJECT])
+                self.values.append(0)
+                stack.append([position, n_fields[code - OBJECT]])
+                continue
+            self.codes.append(code)
+            if code == LIST:
+                n = next(payload)
+                self.values.append(n)
+                if n:
+                    stack.append([position, n])
+                    continue
+            elif code == STR:
+                string = strings[next(payload)]
+                string_id = self.string_ids.setdefault(string, len(self.string_ids))
+                self.values.append(string_id)
+            elif code == INT:
+                self.values.append(next(payload))
+            elif code == FLOAT:
+                self.values.append(len(self.floats))
+                self.floats.append(next(floats))
+            else:
+                self.values.append(0)
+            self.ends[position] = position + 1
+            while stack:
+                stack[-1][1] -= 1
+                if stack[-1][1]:
+                    break
+                self.ends[stack.pop()[0]] = len(self.codes)
+        self.plans.append(len(self.codes))
+
+    def write(self, path: str) -> None:
+        encoded = [s.encode() for s in self.string_ids]
+        string_offsets = array("q", [0])
+        for s in encoded:
+            string_offsets.append(string_offsets[-1] + len(s))
+        arrays = {
+            "plans": self.plans,
+            "codes": self.codes,
+            "values": self.values,
+            "ends": self.ends,
+            "floats": self.floats,
+            "string_offsets": string_offsets,
+            "strings": array("B", b"".join(encoded)),
+        }
+        header = json.dumps(
+            {
+                "classes": CLASS_NAMES,
+                "sections": [[name, len(arrays[name])] for name, _ in SECTIONS],
+            }
+        ).encode()
+        with open(path, mode="wb") as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for name, _ in SECTIONS:
+                # Sections start at multiples of 8 bytes, for aligned reads.
+                f.write(b"\0" * (-f.tell() % 8))
+                f.write(arrays[name].tobytes())
+
+
+def write_corpus(eps: Iterable[ExecutionPlan], path: str) -> int:
+    writer = CorpusWriter()
+    for ep in eps:
+        writer.add(ep)
+    writer.write(path)
+    return len(writer.plans) - 1
+
+
+class PlanCorpus:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, mode="rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.mmap)
+        if buffer[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a plan corpus.")
+        start = len(MAGIC) + 8
+        header_length = int.from_bytes(buffer[len(MAGIC) : start], "little")
+        header = json.loads(bytes(buffer[start : start + header_length]))
+        self.types = [FIELD_NAMES[name] for name in header["classes"]]
+        self.class_names = header["classes"]
+        offset = start + header_length
+        typecodes = dict(SECTIONS)
+        for name, length in header["sections"]:
+            offset += -offset % 8
+            size = length * array(typecodes[name]).itemsize
+            setattr(self, name, buffer[offset : offset + size].cast(typecodes[name]))
+            offset += size
+
+    def __len__(self) -> int:
+        return len(self.plans) - 1
+
+    def __getitem__(self, i: int) -> "NodeView":
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return NodeView(self, self.plans[i])
+
+    def __iter__(self) -> Iterator["NodeView"]:
+        return (NodeView(self, self.plans[i]) for i in range(len(self)))
+
+    def string(self, i: int) -> str:
+        start, end = self.string_offsets[i], self.string_offsets[i + 1]
+        return str(self.strings[start:end], "utf-8")
+
+    def value(self, position: int) -> Any:
+        code = self.codes[position]
+        if code >= OBJECT:
+            return NodeView(self, position)
+        if code == STR:
+            return self.string(self.values[position])
+        if code == LIST:
+            return ListView(self, position)
+        if code == INT:
+            return self.values[position]
+        if code == FLOAT:
+            return self.floats[self.values[position]]
+        return (None, False, True)[code]
+
+    def decode(self, position: int) -> Any:
+        """The `ep_types` object at `position`, decoded into private memory."""
+        positions = range(position, self.ends[position])
+        codes, values = self.codes, self.values
+        return _unflatten(
+            self.types,
+            _Strings(self),
+            bytes(codes[position : self.ends[position]]),
+            (values[i] for i in positions if codes[i] in (STR, INT, LIST)),
+            (self.floats[values[i]] for i in positions if codes[i] == FLOAT),
+        )
+
+    def plan(self, i: int) -> ExecutionPlan:
+        return self.decode(self[i].position)
+
+    def close(self) -> None:
+        for name, _ in SECTIONS:
+            getattr(self, name).release()
+        self.mmap.close()
+
+    def __enter__(self) -> "PlanCorpus":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _Strings:
+    def __init__(self, corpus: PlanCorpus):
+        self.corpus = corpus
+
+    def __getitem__(self, i: int) -> str:
+        return self.corpus.string(i)
+
+
+class NodeView:
+    """An `ep_types` object in a corpus, with its fields read on access."""
+
+    __slots__ = ("corpus", "position")
+
+    def __init__(self, corpus: PlanCorpus, position: int):
+        self.corpus = corpus
+        self.position = position
+
+    @property
+    def type_name(self) -> str:
+        return self.corpus.class_names[self.corpus.codes[self.position] - OBJECT]
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            index = FIELD_INDEX[self.type_name][name]
+        except KeyError:
+            raise AttributeError(f"{self.type_name} has no field {name!r}") from None
+        position = self.position + 1
+        ends = self.corpus.ends
+        for _ in range(index):
+            position = ends[position]
+        return self.corpus.value(position)
+
+    def materialize(self) -> Any:
+        return self.corpus.decode(self.position)
+
+    def __repr__(self):
+        return f"NodeView({self.type_name} at {self.position})"
+
+
+class ListView:
+    __slots__ = ("corpus", "position")
+
+    def __init__(self, corpus: PlanCorpus, position: int):
+        self.corpus = corpus
+        self.position = position
+
+    def __len__(self) -> int:
+        return self.corpus.values[self.position]
+
+    def __iter__(self) -> Iterator[Any]:
+        ends = self.corpus.ends
+        position = self.position + 1
+        for _ in range(len(self)):
+            yield self.corpus.value(position)
+            position = ends[position]
+
+    def __getitem__(self, i: int) -> Any:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        position = self.position + 1
+        for _ in range(i):
+            position = self.corpus.ends[position]
+        return self.corpus.value(position)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    from .ep_reader import get_eps
+
+    split: Literal["train", "dev"] = sys.argv[2] if len(sys.argv) > 2 else "train"
+    n = write_corpus(get_eps(split), sys.argv[1])
+    print(f"Wrote {n} {split} plans to {sys.argv[1]}.")
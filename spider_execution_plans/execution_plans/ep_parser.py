@@ -1,14 +1,109 @@
-from lxml.etree import _Element
+from __future__ import annotations
+
+from contextvars import ContextVar
+from dataclasses import FrozenInstanceError, fields
+from typing import TYPE_CHECKING, Any, Callable, get_args
+
+if TYPE_CHECKING:
+    from lxml.etree import _Element
 
 from .ep_types import *
 
 NS = "http://schemas.microsoft.com/sqlserver/2004/07/showplan"
 
+# Fields holding predicates, defined values and scalar expression trees, which
+# lazy parsing leaves unparsed until they are first accessed.
+LAZY_FIELDS = ("defined_values", "predicate", "predicates", "seek_predicate", "top_expression")
+
+_lazy: ContextVar[bool] = ContextVar("lazy", default=False)
+
+
+def parse(ep: _Element, lazy: bool = False) -> ExecutionPlan:
+    """Parses a showplan.
+
+    With `lazy=True` the fields named in `LAZY_FIELDS` are parsed on first
+    access from the retained lxml elements. The operations of a lazy plan are
+    subclasses of the `ep_types` operations with the same names, compare equal
+    to their eager counterparts and pickle as eager operations.
+    """
+    token = _lazy.set(lazy)
+    try:
+        stmt = ep.find(f".//{{{NS}}}StmtSimple")
+        query = stmt.get("StatementText")
+        return ExecutionPlan(
+            query=query,
+            relop=parse_relop(stmt.find(f".//{{{NS}}}RelOp")),
+            statement_subtree_cost=parse_optional(
+                stmt.get("StatementSubTreeCost"), float
+            ),
+        )
+    finally:
+        _lazy.reset(token)
+
+
+class Deferred:
+    __slots__ = ("parse", "element")
+
+    def __init__(self, parse: Callable[[_Element], Any], element: _Element):
+        self.parse = parse
+        self.element = element
+
+
+def defer(parse: Callable[[_Element], Any], element: _Element):
+    if _lazy.get():
+        return Deferred(parse, element)
+    return parse(element)
+
+
+class LazyField:
+    """Parses a `Deferred` field value on first access and keeps the result."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name]
+        if isinstance(value, Deferred):
+            value = value.parse(value.element)
+            instance.__dict__[self.name] = value
+        return value
+
+    def __set__(self, instance, value):
+        # The frozen dataclass `__init__`, as called by `dataclasses.replace`,
+        # assigns every field once; later assignments are refused.
+        if self.name in instance.__dict__:
+            raise FrozenInstanceError(f"cannot assign to field '{self.name}'")
+        instance.__dict__[self.name] = value
 
-def parse(ep: _Element) -> ExecutionPlan:
-    stmt = ep.find(f".//{{{NS}}}StmtSimple")
-    query = stmt.get("StatementText")
-    return ExecutionPlan(query=query, relop=parse_relop(stmt.find(f".//{{{NS}}}RelOp")))
+
+def lazy_class(cls: type) -> type:
+    names = [f.name for f in fields(cls)]
+
+    def __eq__(self, other):
+        if not isinstance(other, cls):
+            return NotImplemented
+        return all(getattr(self, n) == getattr(other, n) for n in names)
+
+    def __reduce__(self):
+        return cls, tuple(getattr(self, n) for n in names)
+
+    namespace = {n: LazyField(n) for n in names if n in LAZY_FIELDS}
+    namespace.update(
+        __eq__=__eq__,
+        __hash__=cls.__hash__,
+        __reduce__=__reduce__,
+        __qualname__=cls.__qualname__,
+    )
+    return type(cls.__name__, (cls,), namespace)
+
+
+LAZY_CLASSES = {cls: lazy_class(cls) for cls in get_args(RelOpType)}
+
+
+def parse_optional(value: Optional[str], type_: type):
+    return None if value is None else type_(value)
 
 
 def is_compute_scalar(logical_op: str, physical_op: str) -> bool:
@@ -124,7 +219,26 @@ def parse_relop(relop: _Element) -> RelOp:
             f"The pair ({logical_op}, {physical_op}) are not mapped to any operation."
         )
 
-    return RelOp(operation=operation, output_list=output_list)
+    if _lazy.get():
+        object.__setattr__(operation, "__class__", LAZY_CLASSES[type(operation)])
+
+    attrib = relop.attrib
+    parallel = attrib.get("Parallel")
+    return RelOp(
+        operation=operation,
+        output_list=output_list,
+        node_id=parse_optional(attrib.get("NodeId"), int),
+        logical_op=logical_op,
+        physical_op=physical_op,
+        estimate_rows=parse_optional(attrib.get("EstimateRows"), float),
+        estimate_cpu=parse_optional(attrib.get("EstimateCPU"), float),
+        estimate_io=parse_optional(attrib.get("EstimateIO"), float),
+        avg_row_size=parse_optional(attrib.get("AvgRowSize"), int),
+        estimated_total_subtree_cost=parse_optional(
+            attrib.get("EstimatedTotalSubtreeCost"), float
+        ),
+        parallel=None if parallel is None else parallel in ("1", "true"),
+    )
 
 
 def parse_scalar_operator(scalar_operator: _Element) -> ScalarOperator:
@@ -250,7 +364,7 @@ def parse_defined_values(op: _Element) -> list[DefinedValue]:
 
 def parse_compute_scalar(compute_scalar: _Element) -> ComputeScalar:
     relop = parse_relop(compute_scalar.find(f"./{{{NS}}}RelOp"))
-    defined_values = parse_defined_values(compute_scalar)
+    defined_values = defer(parse_defined_values, compute_scalar)
     if (cs := compute_scalar.get("ComputeSequence")) is not None:
         compute_sequence = cs == "1"
         return ComputeScalar(
@@ -279,7 +393,7 @@ def parse_column_reference(column_reference: _Element) -> ColumnReference:
 
 def parse_stream_aggregate(stream_aggregate: _Element) -> StreamAggregate:
     relop = parse_relop(stream_aggregate.find(f"./{{{NS}}}RelOp"))
-    defined_values = parse_defined_values(stream_aggregate)
+    defined_values = defer(parse_defined_values, stream_aggregate)
     if (group_by := stream_aggregate.find(f"./{{{NS}}}GroupBy")) is not None:
         return StreamAggregate(
             group_by=parse_group_by(group_by),
@@ -302,6 +416,10 @@ def parse_predicate(predicate: _Element) -> ScalarOperator:
     return parse_scalar_operator(predicate.find(f"./{{{NS}}}ScalarOperator"))
 
 
+def parse_predicates(op: _Element) -> list[ScalarOperator]:
+    return [parse_predicate(e) for e in op.findall(f"./{{{NS}}}Predicate")]
+
+
 def parse_scan_range(scan_range: _Element) -> ScanRange:
     scan_type = scan_range.attrib["ScanType"]
     range_columns = [
@@ -333,16 +451,14 @@ def parse_seek_predicate(seek_predicate: _Element) -> SeekPredicate:
 
 def parse_index_scan(index_scan: _Element) -> IndexScan:
     obj = parse_object(index_scan.find(f"./{{{NS}}}Object"))
-    defined_values = parse_defined_values(index_scan)
+    defined_values = defer(parse_defined_values, index_scan)
     ordered = index_scan.attrib["Ordered"] == "true"
     seek_predicate_path = (
         f"./{{{NS}}}SeekPredicates/{{{NS}}}SeekPredicateNew/{{{NS}}}SeekKeys"
     )
     if (seek_predicate := index_scan.find(seek_predicate_path)) is not None:
-        seek_predicate = parse_seek_predicate(seek_predicate)
-    predicates = [
-        parse_predicate(e) for e in index_scan.findall(f"./{{{NS}}}Predicate")
-    ]
+        seek_predicate = defer(parse_seek_predicate, seek_predicate)
+    predicates = defer(parse_predicates, index_scan)
     return IndexScan(
         ordered=ordered,
         obj=obj,
@@ -366,7 +482,7 @@ def parse_sort(sort: _Element) -> Sort:
     distinct = sort.attrib["Distinct"] == "1"
     order_by = parse_order_by(sort.find(f"./{{{NS}}}OrderBy"))
     relop = parse_relop(sort.find(f"./{{{NS}}}RelOp"))
-    defined_values = parse_defined_values(sort)
+    defined_values = defer(parse_defined_values, sort)
     return Sort(
         distinct=distinct, order_by=order_by, relop=relop, defined_values=defined_values
     )
@@ -374,12 +490,12 @@ def parse_sort(sort: _Element) -> Sort:
 
 def parse_nested_loops(nested_loops: _Element) -> NestedLoops:
     left, right = [parse_relop(e) for e in nested_loops.findall(f"./{{{NS}}}RelOp")]
-    defined_values = parse_defined_values(nested_loops)
+    defined_values = defer(parse_defined_values, nested_loops)
     if (p := nested_loops.find(f"./{{{NS}}}Predicate")) is not None:
         return NestedLoops(
             left=left,
             right=right,
-            predicate=parse_predicate(p),
+            predicate=defer(parse_predicate, p),
             defined_values=defined_values,
         )
     return NestedLoops(left=left, right=right, defined_values=defined_values)
@@ -388,8 +504,8 @@ def parse_nested_loops(nested_loops: _Element) -> NestedLoops:
 def parse_filter(filter_: _Element) -> Filter:
     startup_expression = filter_.attrib["StartupExpression"] == "1"
     relop = parse_relop(filter_.find(f"./{{{NS}}}RelOp"))
-    predicate = parse_predicate(filter_.find(f"./{{{NS}}}Predicate"))
-    defined_values = parse_defined_values(filter_)
+    predicate = defer(parse_predicate, filter_.find(f"./{{{NS}}}Predicate"))
+    defined_values = defer(parse_defined_values, filter_)
     return Filter(
         startup_expression=startup_expression,
         relop=relop,
@@ -403,7 +519,7 @@ def parse_top_sort(top_sort: _Element) -> TopSort:
     distinct = top_sort.attrib["Distinct"] == "1"
     order_by = parse_order_by(top_sort.find(f"./{{{NS}}}OrderBy"))
     relop = parse_relop(top_sort.find(f"./{{{NS}}}RelOp"))
-    defined_values = parse_defined_values(top_sort)
+    defined_values = defer(parse_defined_values, top_sort)
     return TopSort(
         distinct=distinct,
         order_by=order_by,
@@ -414,11 +530,12 @@ def parse_top_sort(top_sort: _Element) -> TopSort:
 
 
 def parse_top(top: _Element) -> Top:
-    top_expression = parse_scalar_operator(
-        top.find(f"./{{{NS}}}TopExpression/{{{NS}}}ScalarOperator")
+    top_expression = defer(
+        parse_scalar_operator,
+        top.find(f"./{{{NS}}}TopExpression/{{{NS}}}ScalarOperator"),
     )
     relop = parse_relop(top.find(f"./{{{NS}}}RelOp"))
-    defined_values = parse_defined_values(top)
+    defined_values = defer(parse_defined_values, top)
     return Top(
         top_expression=top_expression, relop=relop, defined_values=defined_values
     )
@@ -427,7 +544,7 @@ def parse_top(top: _Element) -> Top:
 def parse_merge(merge: _Element) -> Merge:
     left, right = [parse_relop(e) for e in merge.findall(f"./{{{NS}}}RelOp")]
     join_tags = [f"{{{NS}}}InnerSideJoinColumns", f"{{{NS}}}OuterSideJoinColumns"]
-    defined_values = parse_defined_values(merge)
+    defined_values = defer(parse_defined_values, merge)
     if all([merge.find(t) is not None for t in join_tags]):
         on_left = parse_column_reference(
             merge.find(join_tags[0]).find(f"{{{NS}}}ColumnReference")
@@ -448,12 +565,12 @@ def parse_merge(merge: _Element) -> Merge:
 def parse_table_scan(table_scan: _Element) -> TableScan:
     ordered = table_scan.attrib["Ordered"] == "1"
     obj = parse_object(table_scan.find(f"./{{{NS}}}Object"))
-    defined_values = parse_defined_values(table_scan)
+    defined_values = defer(parse_defined_values, table_scan)
     if (p := table_scan.find(f"./{{{NS}}}Predicate")) is not None:
         return TableScan(
             ordered=ordered,
             obj=obj,
-            predicate=parse_predicate(p),
+            predicate=defer(parse_predicate, p),
             defined_values=defined_values,
         )
     return TableScan(ordered=ordered, obj=obj, defined_values=defined_values)
@@ -461,23 +578,23 @@ def parse_table_scan(table_scan: _Element) -> TableScan:
 
 def parse_hash(hash_: _Element) -> Hash:
     relops = [parse_relop(e) for e in hash_.findall(f"./{{{NS}}}RelOp")]
-    defined_values = parse_defined_values(hash_)
+    defined_values = defer(parse_defined_values, hash_)
     return Hash(relops=relops, defined_values=defined_values)
 
 
 def parse_concat(concat: _Element) -> Concat:
     relops = [parse_relop(e) for e in concat.findall(f"./{{{NS}}}RelOp")]
-    defined_values = parse_defined_values(concat)
+    defined_values = defer(parse_defined_values, concat)
     return Concat(relops=relops, defined_values=defined_values)
 
 
 def parse_row_count_spool(row_count_spool: _Element) -> RowCountSpool:
     relop = parse_relop(row_count_spool.find(f"./{{{NS}}}RelOp"))
-    defined_values = parse_defined_values(row_count_spool)
+    defined_values = defer(parse_defined_values, row_count_spool)
     return RowCountSpool(relop=relop, defined_values=defined_values)
 
 
 def parse_spool(spool: _Element) -> Spool:
     relop = parse_relop(spool.find(f"./{{{NS}}}RelOp"))
-    defined_values = parse_defined_values(spool)
+    defined_values = defer(parse_defined_values, spool)
     return Spool(relop=relop, defined_values=defined_values)
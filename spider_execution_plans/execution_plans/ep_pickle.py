@@ -0,0 +1,178 @@
+"""Flat pickling of `RelOp` trees and `ExecutionPlan`s.
+
+Pickling a plan as a graph of frozen dataclasses stores a class reference and
+a field dictionary per node and recurses once per level. Instead, `RelOp` and
+`ExecutionPlan` reduce to a flat pre-order encoding of the whole tree:
+
+- `codes`: an `array("B")` with the kind of every value, `NONE` ... `OBJECT`
+- `payload`: an `array("i")`, or `array("q")` if needed, with the value of
+  every int, the index of every string and the length of every list
+- `floats`: an `array("d")` of the float values
+- `strings`: every distinct string once
+- `classes`: the names of the `ep_types` classes, referenced by `OBJECT + index`
+
+With protocol 5 the arrays are passed as `pickle.PickleBuffer`s, so
+`pickle.dumps(ep, protocol=5, buffer_callback=...)` can send them out of band.
+The arrays are in native byte order, for transfer between processes on one
+machine. Lazily parsed operations are encoded, and unpickle, as the eager
+`ep_types` classes.
+"""
+
+import pickle
+
+from array import array
+from operator import attrgetter
+from typing import Any, Callable, Iterator, Tuple, Union
+
+from .ep_codec import CLASSES, FIELDS, class_fields, without_gc
+
+NONE, FALSE, TRUE, INT, FLOAT, STR, LIST, OBJECT = range(8)
+
+# The class and field names each class is rebuilt from.
+FIELD_NAMES = {
+    name: (cls, tuple(n for n, _ in FIELDS[cls])) for name, cls in CLASSES.items()
+}
+
+Buffer = Union[bytes, bytearray, memoryview, pickle.PickleBuffer]
+Flat = Tuple[Tuple[str, ...], Tuple[str, ...], str, array, array, array]
+
+
+def _getter(cls: type) -> Callable[[Any], tuple]:
+    names = [name for name, _ in FIELDS.get(cls) or class_fields(cls)]
+    if len(names) == 1:
+        return lambda obj: (getattr(obj, names[0]),)
+    return attrgetter(*names)
+
+
+# Functions returning the field values of an object, as a tuple.
+GETTERS = {cls: _getter(cls) for cls in FIELDS}
+
+
+def flatten(obj: Any) -> Flat:
+    """The `(classes, strings, payload typecode, codes, payload, floats)` of an object."""
+    classes: dict[str, int] = {}
+    strings: dict[str, int] = {}
+    codes = []
+    payload = []
+    floats = []
+    # Iterators over the values of the objects and lists being encoded.
+    stack = [iter((obj,))]
+    while stack:
+        for value in stack[-1]:
+            cls = type(value)
+            if cls is str:
+                codes.append(STR)
+                payload.append(strings.setdefault(value, len(strings)))
+            elif value is None:
+                codes.append(NONE)
+            elif cls is float:
+                codes.append(FLOAT)
+                floats.append(value)
+            elif cls is bool:
+                codes.append(TRUE if value else FALSE)
+            elif cls is int:
+                codes.append(INT)
+                payload.append(value)
+            elif cls is list:
+                codes.append(LIST)
+                payload.append(len(value))
+                if value:
+                    stack.append(iter(value))
+                    break
+            else:
+                getter = GETTERS.get(cls)
+                if getter is None:
+                    getter = GETTERS[cls] = _getter(cls)
+                codes.append(OBJECT + classes.setdefault(cls.__name__, len(classes)))
+                stack.append(iter(getter(value)))
+                break
+        else:
+            stack.pop()
+    try:
+        typecode = "i"
+        payload = array(typecode, payload)
+    except OverflowError:
+        typecode = "q"
+        payload = array(typecode, payload)
+    return (
+        tuple(classes),
+        tuple(strings),
+        typecode,
+        array("B", codes),
+        payload,
+        array("d", floats),
+    )
+
+
+def _array(typecode: str, buffer: Buffer) -> list:
+    values = array(typecode)
+    values.frombytes(memoryview(buffer).cast("B"))
+    return values.tolist()
+
+
+def unflatten(
+    classes: Tuple[str, ...],
+    strings: Tuple[str, ...],
+    typecode: str,
+    codes: Buffer,
+    payload: Buffer,
+    floats: Buffer,
+) -> Any:
+    return without_gc(
+        _unflatten,
+        [FIELD_NAMES[name] for name in classes],
+        strings,
+        bytes(codes),
+        iter(_array(typecode, payload)),
+        iter(_array("d", floats)),
+    )
+
+
+def _unflatten(
+    types: list, strings: Tuple[str, ...], codes: bytes, payload: Iterator, floats: Iterator
+) -> Any:
+    # Objects and lists being filled in, as [values, missing values, class, field names].
+    stack = []
+    for code in codes:
+        if code >= OBJECT:
+            cls, names = types[code - OBJECT]
+            stack.append([[], len(names), cls, names])
+            continue
+        if code == LIST:
+            n = next(payload)
+            if n:
+                stack.append([[], n, None, None])
+                continue
+            value = []
+        elif code == STR:
+            value = strings[next(payload)]
+        elif code == INT:
+            value = next(payload)
+        elif code == FLOAT:
+            value = next(floats)
+        else:
+            value = (None, False, True)[code]
+        while stack:
+            frame = stack[-1]
+            frame[0].append(value)
+            frame[1] -= 1
+            if frame[1]:
+                break
+            stack.pop()
+            value, _, cls, names = frame
+            if cls is not None:
+                obj = cls.__new__(cls)
+                # The classes are frozen; fill in the instance dictionary like pickle does.
+                obj.__dict__.update(zip(names, value))
+                value = obj
+        else:
+            return value
+    raise ValueError("Truncated flat encoding.")
+
+
+def reduce(obj: Any, protocol: int) -> tuple:
+    classes, strings, typecode, *arrays = flatten(obj)
+    if protocol >= 5:
+        buffers = map(pickle.PickleBuffer, arrays)
+        return unflatten, (classes, strings, typecode, *buffers)
+    return unflatten, (classes, strings, typecode, *(a.tobytes() for a in arrays))
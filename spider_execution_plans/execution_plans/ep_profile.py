@@ -0,0 +1,239 @@
+"""Opt-in profiling of loading and parsing execution plans.
+
+`profile()` replaces the stage functions in the `ep_reader` and `ep_parser`
+module namespaces with instrumented wrappers for the duration of a `with`
+block and puts the originals back afterwards, so the pipeline runs unchanged,
+at full speed, outside it:
+
+    with profile() as report:
+        get_eps("dev")
+    print(report)
+
+Time and allocated memory blocks are charged to the innermost running stage,
+so the time of `relop` excludes the operators below it and `construct` is the
+time spent in the `ep_types` constructors. Stages are:
+
+- `shard`: reading a shard of `ep_shards` and checking its SHA-256
+- `decompress`: decompressing a shard
+- `json`, `xml`: JSON decoding in `ep_reader.read` or `ep_shards.read_shard`,
+  and `etree.fromstring`
+- `plan`: `ep_parser.parse` outside of its RelOps
+- `relop`: `parse_relop` outside of its operation
+- `operator:<Type>`: the `parse_<type>` function of each RelOp type
+- `scalar:<Type>`, `scalar`: scalar operators and their dispatch
+- `defined_values`, `column_reference`, `predicate`, `seek_predicate`,
+  `order_by`, `object`, `group_by`
+- `construct`: dataclass construction
+
+The functions are replaced module-wide, so profile one pipeline at a time.
+Stages are charged on a single stack, so shards are read in one thread.
+"""
+
+import json
+import re
+import sys
+import time
+
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, is_dataclass
+from typing import Callable, Iterator, Optional, get_args
+
+from lxml import etree
+
+from . import ep_parser, ep_reader, ep_shards
+from .ep_types import RelOpType, ScalarOperator
+
+# Called as each stage returns, with its name, own seconds and own net allocated blocks.
+Hook = Callable[[str, float, int], None]
+
+
+def snake_case(name: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+PARSER_STAGES = {
+    "parse": "plan",
+    "parse_relop": "relop",
+    "parse_scalar_operator": "scalar",
+    "parse_defined_values": "defined_values",
+    "parse_column_reference": "column_reference",
+    "parse_predicate": "predicate",
+    "parse_seek_predicate": "seek_predicate",
+    "parse_order_by": "order_by",
+    "parse_object": "object",
+    "parse_group_by": "group_by",
+    **{
+        f"parse_{snake_case(cls.__name__)}": f"operator:{cls.__name__}"
+        for cls in get_args(RelOpType)
+    },
+    **{
+        f"parse_{snake_case(cls.__name__)}": f"scalar:{cls.__name__}"
+        for cls in get_args(ScalarOperator)
+    },
+}
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    seconds: float = 0.0
+    allocated_blocks: int = 0
+
+
+@dataclass
+class ProfileReport:
+    """Per-stage calls, own time and own net change in allocated memory blocks."""
+
+    stages: dict[str, StageStats] = field(default_factory=dict)
+    wall_seconds: float = 0.0
+
+    def operators(self) -> dict[str, StageStats]:
+        return {
+            name.split(":", 1)[1]: stats
+            for name, stats in self.stages.items()
+            if name.startswith("operator:")
+        }
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def __str__(self):
+        lines = [f"{'':<28} {'calls':>10} {'seconds':>10} {'share':>7} {'blocks':>12}"]
+        total = sum(s.seconds for s in self.stages.values()) or 1.0
+        for name, s in sorted(self.stages.items(), key=lambda item: -item[1].seconds):
+            lines.append(
+                f"{name:<28} {s.calls:>10} {s.seconds:>10.4f} "
+                f"{s.seconds / total:>7.1%} {s.allocated_blocks:>12}"
+            )
+        lines.append(f"Wall time: {self.wall_seconds:.4f}s")
+        return "\n".join(lines)
+
+
+class ModuleProxy:
+    """Stands in for a module global, with some of its attributes replaced."""
+
+    def __init__(self, module, **overrides):
+        self._module = module
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name: str):
+        return getattr(self._module, name)
+
+
+class Profiler:
+    def __init__(self, allocations: bool = False, hook: Optional[Hook] = None):
+        self.report = ProfileReport()
+        self.allocations = allocations
+        self.hook = hook
+        self.active = False
+        # The running stages, innermost last, as [stage, own seconds, own blocks].
+        self.stack: list[list] = []
+        self.mark = 0.0
+        self.blocks = 0
+        self.saved: list[tuple] = []
+
+    def _charge(self) -> None:
+        now = time.perf_counter()
+        blocks = sys.getallocatedblocks() if self.allocations else 0
+        if self.stack:
+            frame = self.stack[-1]
+            frame[1] += now - self.mark
+            frame[2] += blocks - self.blocks
+        self.blocks = blocks
+        # Counting blocks is slow, and is left out of the next stage's time.
+        self.mark = time.perf_counter() if self.allocations else now
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            # Lazily parsed fields can call a wrapper after profiling has ended.
+            if not self.active:
+                return fn(*args, **kwargs)
+            self._charge()
+            self.stack.append([stage, 0.0, 0])
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._charge()
+                _, seconds, blocks = self.stack.pop()
+                stats = self.report.stages.get(stage)
+                if stats is None:
+                    stats = self.report.stages[stage] = StageStats()
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.allocated_blocks += blocks
+                if self.hook is not None:
+                    self.hook(stage, seconds, blocks)
+
+        return wrapper
+
+    def _replace(self, module, name: str, value) -> None:
+        self.saved.append((module, name, getattr(module, name)))
+        setattr(module, name, value)
+
+    def install(self) -> None:
+        self._replace(
+            ep_reader, "json", ModuleProxy(json, load=self.wrap("json", json.load))
+        )
+        read_shards = ep_shards.read_shards
+        self._replace(
+            ep_reader,
+            "read_shards",
+            lambda directory, db_ids=None, jobs=None: read_shards(directory, db_ids, 1),
+        )
+        self._replace(ep_shards, "read_shard", self.wrap("shard", ep_shards.read_shard))
+        self._replace(
+            ep_shards, "json", ModuleProxy(json, loads=self.wrap("json", json.loads))
+        )
+        codecs = {}
+        for codec, (module, suffix) in ep_shards.CODECS.items():
+            decompress = self.wrap("decompress", module.decompress)
+            codecs[codec] = (ModuleProxy(module, decompress=decompress), suffix)
+        self._replace(ep_shards, "CODECS", codecs)
+        self._replace(
+            ep_reader,
+            "etree",
+            ModuleProxy(etree, fromstring=self.wrap("xml", etree.fromstring)),
+        )
+        self._replace(ep_reader, "parse", self.wrap("plan", ep_parser.parse))
+        for name, stage in PARSER_STAGES.items():
+            self._replace(ep_parser, name, self.wrap(stage, getattr(ep_parser, name)))
+        for name, value in list(vars(ep_parser).items()):
+            if isinstance(value, type) and is_dataclass(value):
+                self._replace(ep_parser, name, self.wrap("construct", value))
+        self.active = True
+        self.mark = time.perf_counter()
+        self.blocks = sys.getallocatedblocks() if self.allocations else 0
+
+    def uninstall(self) -> None:
+        self.active = False
+        while self.saved:
+            module, name, value = self.saved.pop()
+            setattr(module, name, value)
+
+
+@contextmanager
+def profile(
+    allocations: bool = False, hook: Optional[Hook] = None
+) -> Iterator[ProfileReport]:
+    """Profiles `ep_reader` and `ep_parser` inside the block.
+
+    With `allocations=True` the net change in allocated memory blocks is
+    counted too. That walks the allocator's arenas on every stage change and
+    slows the run down many times over, although the stage times exclude it.
+    """
+    profiler = Profiler(allocations, hook)
+    start = time.perf_counter()
+    profiler.install()
+    try:
+        yield profiler.report
+    finally:
+        profiler.uninstall()
+        profiler.report.wall_seconds = time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    split = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] in ("train", "dev") else "dev"
+    with profile(allocations="--allocations" in sys.argv) as report:
+        eps = ep_reader.get_eps(split)
+    print(f"Parsed {len(eps)} {split} plans.")
+    print(report)
@@ -1,22 +1,64 @@
 import json
+import os
 
 from dataclasses import dataclass
-from typing import Literal, Tuple
+from typing import Iterable, Literal, Optional, Tuple
 
 from lxml import etree
 from lxml.etree import _Element
 
 from .ep_parser import parse
+from .ep_shards import MANIFEST, read_shards
 from .ep_types import ExecutionPlan
 
+DATASET_DIR = "dataset"
 
-def read(split: Literal["train", "dev"]) -> list[_Element]:
+
+def dataset_path(split: Literal["train", "dev"]) -> str:
     assert split in (
         "train",
         "dev",
     ), 'The "split" parameter must be either "train" or "dev".'
-    with open(f"dataset/{split}_spider_with_ep.json", encoding="utf-8") as f:
-        return json.load(f)
+    return f"{DATASET_DIR}/{split}_spider_with_ep.json"
+
+
+def shards_dir(split: Literal["train", "dev"]) -> str:
+    return f"{dataset_path(split)[: -len('.json')]}_shards"
+
+
+def source_path(split: Literal["train", "dev"]) -> str:
+    """The file `read` reads a split from: the shard manifest if there is one."""
+    manifest = f"{shards_dir(split)}/{MANIFEST}"
+    return manifest if os.path.exists(manifest) else dataset_path(split)
+
+
+def read(
+    split: Literal["train", "dev"],
+    db_ids: Optional[Iterable[str]] = None,
+    jobs: Optional[int] = None,
+) -> list[dict]:
+    """The instances of a split, from its shards if it has been sharded.
+
+    With `db_ids`, only the instances of those databases, and with shards only
+    the shards holding them are read. `jobs` is the number of shard reading threads.
+    """
+    path = source_path(split)
+    if path != dataset_path(split):
+        return read_shards(shards_dir(split), db_ids, jobs)
+    with open(path, encoding="utf-8") as f:
+        instances = json.load(f)
+    if db_ids is not None:
+        db_ids = set(db_ids)
+        instances = [ins for ins in instances if ins["db_id"] in db_ids]
+    return instances
+
+
+def get_eps(
+    split: Literal["train", "dev"],
+    lazy: bool = False,
+    db_ids: Optional[Iterable[str]] = None,
+) -> list[ExecutionPlan]:
+    return [parse(etree.fromstring(ins["ep"]), lazy) for ins in read(split, db_ids)]
 
 
 def get_train_dev_xmls() -> Tuple[list[_Element], list[_Element]]:
@@ -25,10 +67,12 @@ def get_train_dev_xmls() -> Tuple[list[_Element], list[_Element]]:
     return train, dev
 
 
-def get_train_dev_eps() -> Tuple[list[ExecutionPlan], list[ExecutionPlan]]:
+def get_train_dev_eps(
+    lazy: bool = False,
+) -> Tuple[list[ExecutionPlan], list[ExecutionPlan]]:
     train, dev = get_train_dev_xmls()
-    train_eps = [parse(ep) for ep in train]
-    dev_eps = [parse(ep) for ep in dev]
+    train_eps = [parse(ep, lazy) for ep in train]
+    dev_eps = [parse(ep, lazy) for ep in dev]
     return train_eps, dev_eps
 
 
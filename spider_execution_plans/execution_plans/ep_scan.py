@@ -0,0 +1,113 @@
+"""Fast metadata scan of raw showplan XML strings.
+
+`scan_plan` reads the statement text, the (LogicalOp, PhysicalOp) pairs, the
+scanned tables and the RelOp depth of a plan with a handful of regular
+expressions, without building an XML tree or an `ExecutionPlan`.
+"""
+
+import html
+import re
+import time
+
+from dataclasses import dataclass
+from typing import Literal
+
+from .ep_types import ExecutionPlan, child_relops
+
+STATEMENT_TEXT = re.compile(r'<StmtSimple\s[^>]*?StatementText="([^"]*)"')
+TAG = re.compile(r"<(/?)(RelOp|Object)\b([^>]*)>")
+LOGICAL_OP = re.compile(r'\sLogicalOp="([^"]*)"')
+PHYSICAL_OP = re.compile(r'\sPhysicalOp="([^"]*)"')
+SCHEMA = re.compile(r'\sSchema="([^"]*)"')
+TABLE = re.compile(r'\sTable="([^"]*)"')
+RAW_WHITESPACE = re.compile(r"\r\n|[\r\n\t]")
+
+
+@dataclass(frozen=True)
+class PlanSummary:
+    statement_text: str
+    operators: frozenset[tuple[str, str]]
+    tables: frozenset[tuple[str, str]]
+    depth: int
+
+
+def attribute_value(raw: str) -> str:
+    """Decodes an attribute value the way an XML parser does."""
+    if "&" not in raw and "\n" not in raw and "\r" not in raw and "\t" not in raw:
+        return raw
+    return html.unescape(RAW_WHITESPACE.sub(" ", raw))
+
+
+def scan_plan(xml: str) -> PlanSummary:
+    statement_text = attribute_value(STATEMENT_TEXT.search(xml).group(1))
+    operators = set()
+    tables = set()
+    depth = max_depth = 0
+    for m in TAG.finditer(xml):
+        closing, tag, attributes = m.groups()
+        if tag == "Object":
+            tables.add(
+                (
+                    attribute_value(SCHEMA.search(attributes).group(1)),
+                    attribute_value(TABLE.search(attributes).group(1)),
+                )
+            )
+        elif closing:
+            depth -= 1
+        else:
+            depth += 1
+            max_depth = max(max_depth, depth)
+            operators.add(
+                (
+                    attribute_value(LOGICAL_OP.search(attributes).group(1)),
+                    attribute_value(PHYSICAL_OP.search(attributes).group(1)),
+                )
+            )
+    return PlanSummary(statement_text, frozenset(operators), frozenset(tables), max_depth)
+
+
+def summarize_plan(ep: ExecutionPlan) -> PlanSummary:
+    """The same summary as `scan_plan`, taken from a fully parsed plan."""
+    operators = set()
+    tables = set()
+    max_depth = 0
+    stack = [(ep.relop, 1)]
+    while stack:
+        relop, depth = stack.pop()
+        max_depth = max(max_depth, depth)
+        operators.add((relop.logical_op, relop.physical_op))
+        obj = getattr(relop.operation, "obj", None)
+        if obj is not None:
+            tables.add((obj.schema, obj.table))
+        stack.extend((child, depth + 1) for child in child_relops(relop))
+    return PlanSummary(ep.query, frozenset(operators), frozenset(tables), max_depth)
+
+
+def scan_split(split: Literal["train", "dev"]) -> list[PlanSummary]:
+    from .ep_reader import read
+
+    return [scan_plan(ins["ep"]) for ins in read(split)]
+
+
+def check_scan(split: Literal["train", "dev"]) -> list[int]:
+    """Returns the indices of the instances where the scan and the parser disagree."""
+    from lxml import etree
+
+    from .ep_parser import parse
+    from .ep_reader import read
+
+    instances = read(split)
+    start = time.perf_counter()
+    scanned = [scan_plan(ins["ep"]) for ins in instances]
+    scan_time = time.perf_counter() - start
+    start = time.perf_counter()
+    parsed = [summarize_plan(parse(etree.fromstring(ins["ep"]))) for ins in instances]
+    parse_time = time.perf_counter() - start
+    print(f"{split}: scan {scan_time:.2f}s, parse {parse_time:.2f}s")
+    return [i for i, (s, p) in enumerate(zip(scanned, parsed)) if s != p]
+
+
+if __name__ == "__main__":
+    for split in ("train", "dev"):
+        mismatches = check_scan(split)
+        print(f"{split}: {len(mismatches)} mismatches {mismatches[:10]}")
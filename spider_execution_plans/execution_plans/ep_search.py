@@ -1,4 +1,3 @@
-from .ep_reader import get_train_dev_eps
 from .ep_types import *
 
 
@@ -12,17 +11,14 @@ def query(ep: ExecutionPlan, q, **kwargs):
         if isinstance(op, q) and all([getattr(op, k) == v for k, v in kwargs.items()]):
             result.append(op)
 
-        if hasattr(op, "relop"):
-            stack.append(op.relop)
-        elif hasattr(op, "relops"):
-            stack.extend(op.relops)
-        elif hasattr(op, "left"):
-            stack.extend([op.left, op.right])
+        stack.extend(child_relops(relop))
 
     return result
 
 
 def query_all(q, **kwargs):
+    from .ep_reader import get_train_dev_eps
+
     train, dev = get_train_dev_eps()
     train_results = [result for ep in train for result in query(ep, q, **kwargs)]
     dev_results = [result for ep in dev for result in query(ep, q, **kwargs)]
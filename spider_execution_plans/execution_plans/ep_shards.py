@@ -0,0 +1,177 @@
+"""A sharded, compressed layout of the dataset splits.
+
+A split becomes a directory of JSON Lines shards, each compressed with a
+stdlib codec, and a `manifest.json` listing every shard with its record
+count, size, SHA-256 and db_ids:
+
+    dataset/train_spider_with_ep_shards/manifest.json
+    dataset/train_spider_with_ep_shards/00000-5d41402abc4b2a76.jsonl.xz
+    ...
+
+A shard is named after its position and the start of its SHA-256, so a rewrite
+never changes a shard of the current manifest, and every shard is checked
+against its SHA-256 and record count when read.
+
+The instances of a database are never split across shards, so a subset of
+databases is read from a subset of the shards. Every record keeps its index in
+the split under `idx`, and `read_shards` returns the instances in split order.
+Shards are read in threads; the codecs release the GIL while decompressing.
+
+    python -m spider_execution_plans.execution_plans.ep_shards [--codec lzma]
+"""
+
+import bz2
+import gzip
+import hashlib
+import json
+import lzma
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+from ..plan_writer import INDEX_KEY
+
+MANIFEST = "manifest.json"
+# The module and file suffix of each codec.
+CODECS = {"lzma": (lzma, ".xz"), "gzip": (gzip, ".gz"), "bz2": (bz2, ".bz2")}
+
+
+def read_manifest(directory: Union[str, Path]) -> dict:
+    with open(Path(directory) / MANIFEST, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_shards(
+    instances: list[dict],
+    directory: Union[str, Path],
+    codec: str = "lzma",
+    shard_records: int = 500,
+) -> dict:
+    """Writes the shards of a split and returns their manifest.
+
+    Databases are added to a shard, in order of first appearance, until it
+    holds at least `shard_records` instances. The manifest is written last,
+    and then the shards of an earlier manifest that are not reused are removed.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}, expected one of {sorted(CODECS)}.")
+    module, suffix = CODECS[codec]
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    by_db: dict[str, list[bytes]] = {}
+    for idx, instance in enumerate(instances):
+        record = json.dumps({INDEX_KEY: idx, **instance}, separators=(",", ":"))
+        by_db.setdefault(instance["db_id"], []).append(record.encode())
+    groups: list[list[str]] = [[]]
+    count = 0
+    for db_id, records in by_db.items():
+        if count >= shard_records:
+            groups.append([])
+            count = 0
+        groups[-1].append(db_id)
+        count += len(records)
+    shards = []
+    for i, db_ids in enumerate(g for g in groups if g):
+        lines = [line for db_id in db_ids for line in by_db[db_id]]
+        data = module.compress(b"\n".join(lines) + b"\n")
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{i:05d}-{digest[:16]}.jsonl{suffix}"
+        _write_atomic(directory / name, data)
+        shards.append(
+            {
+                "file": name,
+                "records": len(lines),
+                "bytes": len(data),
+                "sha256": digest,
+                "db_ids": sorted(db_ids),
+            }
+        )
+    manifest = {"codec": codec, "records": len(instances), "shards": shards}
+    _write_atomic(directory / MANIFEST, json.dumps(manifest, indent=1).encode())
+    names = {shard["file"] for shard in shards}
+    for path in directory.glob("*.jsonl.*"):
+        if path.name not in names:
+            path.unlink()
+    return manifest
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # Written to a temporary file first, so a crash never leaves a torn file.
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, mode="wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_shard(directory: Union[str, Path], shard: dict, codec: str) -> list[dict]:
+    """The records of a shard, checked against its manifest entry."""
+    module, _ = CODECS[codec]
+    path = Path(directory) / shard["file"]
+    with open(path, mode="rb") as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != shard["sha256"]:
+        raise ValueError(f"{path} does not match the SHA-256 in its manifest.")
+    data = module.decompress(data)
+    # One JSON document instead of one per line, which is decoded in a single call.
+    records = json.loads(b"[" + data.rstrip(b"\n").replace(b"\n", b",") + b"]")
+    if len(records) != shard["records"]:
+        raise ValueError(
+            f"{path} has {len(records)} records, its manifest lists {shard['records']}."
+        )
+    return records
+
+
+def read_shards(
+    directory: Union[str, Path],
+    db_ids: Optional[Iterable[str]] = None,
+    jobs: Optional[int] = None,
+) -> list[dict]:
+    """The instances of a sharded split, in split order, optionally only of `db_ids`.
+
+    Only the shards holding one of `db_ids` are read, with `jobs` threads, by
+    default one per CPU: more threads than CPUs only contend for the GIL.
+    """
+    directory = Path(directory)
+    manifest = read_manifest(directory)
+    shards = manifest["shards"]
+    if db_ids is not None:
+        db_ids = set(db_ids)
+        shards = [shard for shard in shards if not db_ids.isdisjoint(shard["db_ids"])]
+    codec = manifest["codec"]
+    with ThreadPoolExecutor(jobs or os.cpu_count()) as pool:
+        parts = pool.map(lambda shard: read_shard(directory, shard, codec), shards)
+        records = [record for part in parts for record in part]
+    if db_ids is not None:
+        records = [record for record in records if record["db_id"] in db_ids]
+    records.sort(key=lambda record: record[INDEX_KEY])
+    for record in records:
+        del record[INDEX_KEY]
+    return records
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .ep_reader import dataset_path, shards_dir
+
+    parser = argparse.ArgumentParser(
+        description="Writes the shards of the dataset splits from their legacy JSON files."
+    )
+    parser.add_argument("splits", nargs="*", default=["train", "dev"])
+    parser.add_argument("--codec", choices=sorted(CODECS), default="lzma")
+    parser.add_argument("--shard-records", type=int, default=500)
+    args = parser.parse_args()
+    for split in args.splits:
+        with open(dataset_path(split), encoding="utf-8") as f:
+            instances = json.load(f)
+        manifest = write_shards(instances, shards_dir(split), args.codec, args.shard_records)
+        size = sum(shard["bytes"] for shard in manifest["shards"])
+        print(
+            f"Wrote {manifest['records']} {split} instances to "
+            f"{len(manifest['shards'])} shards of {size / 2**20:.1f} MiB in total "
+            f"({os.path.getsize(dataset_path(split)) / 2**20:.1f} MiB as JSON)."
+        )
@@ -0,0 +1,170 @@
+"""Vectorized analytics over the optimizer cost estimates of execution plans."""
+
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .ep_types import ExecutionPlan, child_relops
+
+COST_FIELDS = (
+    "estimate_rows",
+    "estimate_cpu",
+    "estimate_io",
+    "avg_row_size",
+    "estimated_total_subtree_cost",
+)
+
+
+@dataclass(frozen=True)
+class CostTable:
+    """The RelOps of a split in pre-order, one row per RelOp, as parallel arrays.
+
+    Operators and db_ids are stored as codes into `operators` and `db_ids`, and
+    missing estimates are NaN.
+    """
+
+    plan: np.ndarray
+    parent: np.ndarray
+    depth: np.ndarray
+    operator: np.ndarray
+    operators: list[str]
+    db_id: np.ndarray
+    db_ids: list[str]
+    costs: np.ndarray
+    statement_costs: np.ndarray
+
+    def column(self, name: str) -> np.ndarray:
+        if name == "estimated_self_cost":
+            return self.self_costs()
+        return self.costs[:, COST_FIELDS.index(name)]
+
+    def self_costs(self) -> np.ndarray:
+        """The subtree cost of each RelOp minus the subtree costs of its children."""
+        subtree = self.column("estimated_total_subtree_cost")
+        has_parent = self.parent >= 0
+        children = np.bincount(
+            self.parent[has_parent],
+            weights=np.nan_to_num(subtree[has_parent]),
+            minlength=len(subtree),
+        )
+        return subtree - children
+
+
+@dataclass(frozen=True)
+class CostSummary:
+    keys: list
+    count: np.ndarray
+    total: np.ndarray
+    mean: np.ndarray
+    min: np.ndarray
+    p50: np.ndarray
+    p90: np.ndarray
+    max: np.ndarray
+
+    def __str__(self):
+        lines = [
+            f"{'':<30} {'count':>8} {'total':>12} {'mean':>12} "
+            f"{'min':>12} {'p50':>12} {'p90':>12} {'max':>12}"
+        ]
+        for i, key in enumerate(self.keys):
+            lines.append(
+                f"{str(key):<30} {self.count[i]:>8} {self.total[i]:>12.6g} "
+                f"{self.mean[i]:>12.6g} {self.min[i]:>12.6g} {self.p50[i]:>12.6g} "
+                f"{self.p90[i]:>12.6g} {self.max[i]:>12.6g}"
+            )
+        return "\n".join(lines)
+
+
+def cost_table(
+    eps: Sequence[ExecutionPlan], db_ids: Optional[Sequence[str]] = None
+) -> CostTable:
+    operator_codes: dict[str, int] = {}
+    db_id_codes: dict[str, int] = {}
+    plan = []
+    parent = []
+    depth = []
+    operator = []
+    db_id = []
+    costs = []
+    for i, ep in enumerate(eps):
+        db_code = -1 if db_ids is None else db_id_codes.setdefault(db_ids[i], len(db_id_codes))
+        stack = [(ep.relop, -1, 0)]
+        while stack:
+            relop, parent_row, d = stack.pop()
+            row = len(plan)
+            name = relop.physical_op or type(relop.operation).__name__
+            plan.append(i)
+            parent.append(parent_row)
+            depth.append(d)
+            operator.append(operator_codes.setdefault(name, len(operator_codes)))
+            db_id.append(db_code)
+            costs.append(tuple(getattr(relop, f) for f in COST_FIELDS))
+            stack.extend((child, row, d + 1) for child in reversed(child_relops(relop)))
+    return CostTable(
+        plan=np.array(plan, dtype=np.int32),
+        parent=np.array(parent, dtype=np.int64),
+        depth=np.array(depth, dtype=np.int32),
+        operator=np.array(operator, dtype=np.int32),
+        operators=list(operator_codes),
+        db_id=np.array(db_id, dtype=np.int32),
+        db_ids=list(db_id_codes),
+        costs=np.array(costs, dtype=np.float64).reshape(-1, len(COST_FIELDS)),
+        statement_costs=np.array([ep.statement_subtree_cost for ep in eps], dtype=np.float64),
+    )
+
+
+def summarize(values: np.ndarray, groups: np.ndarray, keys: Sequence) -> CostSummary:
+    """Distribution of `values` for each group code, ignoring NaNs and unknown groups."""
+    valid = ~np.isnan(values) & (groups >= 0)
+    values = values[valid]
+    groups = groups[valid]
+    order = np.lexsort((values, groups))
+    values = values[order]
+    groups = groups[order]
+    present, starts, count = np.unique(groups, return_index=True, return_counts=True)
+    if len(values) == 0:
+        empty = np.empty(0)
+        return CostSummary([], count, empty, empty, empty, empty, empty, empty)
+    total = np.add.reduceat(values, starts)
+
+    def quantile(q: float) -> np.ndarray:
+        return values[starts + np.floor(q * (count - 1)).astype(np.int64)]
+
+    return CostSummary(
+        keys=[keys[g] for g in present],
+        count=count,
+        total=total,
+        mean=total / count,
+        min=values[starts],
+        p50=quantile(0.5),
+        p90=quantile(0.9),
+        max=values[starts + count - 1],
+    )
+
+
+def by_operator(table: CostTable, field: str = "estimated_self_cost") -> CostSummary:
+    return summarize(table.column(field), table.operator, table.operators)
+
+
+def by_db_id(table: CostTable, field: str = "estimated_self_cost") -> CostSummary:
+    return summarize(table.column(field), table.db_id, table.db_ids)
+
+
+def by_depth(table: CostTable, field: str = "estimated_self_cost") -> CostSummary:
+    depths = range(int(table.depth.max(initial=0)) + 1)
+    return summarize(table.column(field), table.depth, depths)
+
+
+if __name__ == "__main__":
+    from .ep_reader import get_train_dev_spider_instances
+
+    train, _ = get_train_dev_spider_instances()
+    table = cost_table([ins.ep for ins in train], [ins.db_id for ins in train])
+    for title, summary in (
+        ("Operator", by_operator(table)),
+        ("Database", by_db_id(table)),
+        ("Depth", by_depth(table)),
+    ):
+        print(title)
+        print(summary, end="\n\n")
@@ -0,0 +1,384 @@
+"""A SQLite store of parsed execution plans for ad-hoc analytics.
+
+Every instance becomes a row of `instances`, every RelOp a row of `relops`
+keyed by its pre-order position in the plan with a link to its parent, every
+scanned object a row of `objects`, and every column reference in a RelOp a
+row of `columns`. The role of a column is the RelOp or operation field it was
+found in, e.g. `output_list`, `defined_values`, `predicate` or `order_by`.
+
+    store = PlanStore()
+    store.load_split("train")  # or sync_split, to redo only what changed
+    store.db_ids(physical_op="Hash Match", min_children=4)
+"""
+
+import sqlite3
+
+from dataclasses import dataclass, fields, is_dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+
+from ..manifest import instance_hash
+from .ep_types import ColumnReference, ExecutionPlan, Object, RelOp, child_relops
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    id INTEGER PRIMARY KEY,
+    split TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    db_id TEXT NOT NULL,
+    query TEXT NOT NULL,
+    question TEXT NOT NULL,
+    statement_subtree_cost REAL,
+    content_hash TEXT,
+    UNIQUE (split, idx)
+);
+CREATE TABLE IF NOT EXISTS relops (
+    instance_id INTEGER NOT NULL REFERENCES instances (id),
+    node INTEGER NOT NULL,
+    parent INTEGER,
+    depth INTEGER NOT NULL,
+    node_id INTEGER,
+    operation TEXT NOT NULL,
+    logical_op TEXT,
+    physical_op TEXT,
+    n_children INTEGER NOT NULL,
+    estimate_rows REAL,
+    estimate_cpu REAL,
+    estimate_io REAL,
+    avg_row_size INTEGER,
+    estimated_total_subtree_cost REAL,
+    PRIMARY KEY (instance_id, node)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS objects (
+    instance_id INTEGER NOT NULL REFERENCES instances (id),
+    node INTEGER NOT NULL,
+    schema_name TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    alias TEXT,
+    index_name TEXT
+);
+CREATE TABLE IF NOT EXISTS columns (
+    instance_id INTEGER NOT NULL REFERENCES instances (id),
+    node INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    schema_name TEXT,
+    table_name TEXT,
+    alias TEXT,
+    column_name TEXT NOT NULL
+);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS instances_db_id ON instances (db_id);
+CREATE INDEX IF NOT EXISTS relops_operator ON relops (physical_op, logical_op);
+CREATE INDEX IF NOT EXISTS relops_operation ON relops (operation);
+CREATE INDEX IF NOT EXISTS relops_parent ON relops (instance_id, parent);
+CREATE INDEX IF NOT EXISTS objects_instance ON objects (instance_id, node);
+CREATE INDEX IF NOT EXISTS objects_table ON objects (schema_name, table_name);
+CREATE INDEX IF NOT EXISTS columns_instance ON columns (instance_id, node);
+CREATE INDEX IF NOT EXISTS columns_column ON columns (table_name, column_name);
+"""
+# Keyword filters of the query API and the SQL they add to the WHERE clause.
+FILTERS = {
+    "split": "i.split = ?",
+    "db_id": "i.db_id = ?",
+    "operation": "r.operation = ?",
+    "logical_op": "r.logical_op = ?",
+    "physical_op": "r.physical_op = ?",
+    "min_children": "r.n_children >= ?",
+    "max_children": "r.n_children <= ?",
+    "min_depth": "r.depth >= ?",
+    "table": "EXISTS (SELECT 1 FROM objects o WHERE o.instance_id = r.instance_id "
+    "AND o.node = r.node AND o.table_name = ?)",
+}
+BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class StoredRelOp:
+    split: str
+    idx: int
+    db_id: str
+    node: int
+    parent: Optional[int]
+    depth: int
+    operation: str
+    logical_op: Optional[str]
+    physical_op: Optional[str]
+    n_children: int
+
+
+def column_references(obj) -> Iterator[Tuple[str, ColumnReference]]:
+    """The column references in the fields of an operation, with the field they are in."""
+    for f in fields(obj):
+        stack = [getattr(obj, f.name)]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, ColumnReference):
+                yield f.name, value
+            elif isinstance(value, list):
+                stack.extend(value)
+            elif is_dataclass(value) and not isinstance(value, RelOp):
+                stack.extend(getattr(value, g.name) for g in fields(value))
+
+
+def plan_rows(instance_id: int, ep: ExecutionPlan) -> Tuple[list, list, list]:
+    relops = []
+    objects = []
+    columns = []
+    stack: list[Tuple[RelOp, Optional[int], int]] = [(ep.relop, None, 0)]
+    while stack:
+        relop, parent, depth = stack.pop()
+        node = len(relops)
+        operation = relop.operation
+        children = child_relops(relop)
+        relops.append(
+            (
+                instance_id,
+                node,
+                parent,
+                depth,
+                relop.node_id,
+                type(operation).__name__,
+                relop.logical_op,
+                relop.physical_op,
+                len(children),
+                relop.estimate_rows,
+                relop.estimate_cpu,
+                relop.estimate_io,
+                relop.avg_row_size,
+                relop.estimated_total_subtree_cost,
+            )
+        )
+        obj = getattr(operation, "obj", None)
+        if isinstance(obj, Object):
+            objects.append(
+                (instance_id, node, obj.schema, obj.table, obj.alias, obj.index)
+            )
+        references = [("output_list", c) for c in relop.output_list]
+        references.extend(column_references(operation))
+        columns.extend(
+            (instance_id, node, role, c.schema, c.table, c.alias, c.column)
+            for role, c in references
+        )
+        stack.extend((child, node, depth + 1) for child in reversed(children))
+    return relops, objects, columns
+
+
+class PlanStore:
+    def __init__(self, path: str = "plan_store.sqlite3"):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        columns = {row[1] for row in self.execute("PRAGMA table_info(instances)")}
+        if "content_hash" not in columns:
+            self.connection.execute("ALTER TABLE instances ADD COLUMN content_hash TEXT")
+
+    def load(self, split: str, instances: Iterable[Tuple[dict, ExecutionPlan]]) -> int:
+        """Replaces the instances of `split` with `(instance, parsed plan)` pairs, in order.
+
+        The whole load runs in one transaction, with rows inserted in batches
+        by `executemany` and the indexes created at the end.
+        """
+        with self.connection:
+            self._delete_split(split)
+            n = self._add(split, ((idx, *pair) for idx, pair in enumerate(instances)))
+        self.connection.executescript(INDEXES)
+        return n
+
+    def _add(self, split: str, instances: Iterable[Tuple[int, dict, ExecutionPlan]]) -> int:
+        next_id = self.connection.execute(
+            "SELECT COALESCE(MAX(id), -1) + 1 FROM instances"
+        ).fetchone()[0]
+        batch = ([], [], [], [])
+        n = 0
+        for n, (idx, instance, ep) in enumerate(instances, start=1):
+            instance_id = next_id + n - 1
+            batch[0].append(
+                (
+                    instance_id,
+                    split,
+                    idx,
+                    instance["db_id"],
+                    instance["query"],
+                    instance["question"],
+                    ep.statement_subtree_cost,
+                    instance_hash(instance),
+                )
+            )
+            for rows, new_rows in zip(batch[1:], plan_rows(instance_id, ep)):
+                rows.extend(new_rows)
+            if len(batch[0]) >= BATCH_SIZE:
+                self._insert(*batch)
+                batch = ([], [], [], [])
+        self._insert(*batch)
+        return n
+
+    def _delete_split(self, split: str) -> None:
+        ids = "SELECT id FROM instances WHERE split = ?"
+        for table in ("relops", "objects", "columns"):
+            self.connection.execute(
+                f"DELETE FROM {table} WHERE instance_id IN ({ids})", (split,)
+            )
+        self.connection.execute("DELETE FROM instances WHERE split = ?", (split,))
+
+    def _delete_ids(self, ids: list[int]) -> None:
+        parameters = [(i,) for i in ids]
+        for table in ("relops", "objects", "columns"):
+            self.connection.executemany(
+                f"DELETE FROM {table} WHERE instance_id = ?", parameters
+            )
+        self.connection.executemany("DELETE FROM instances WHERE id = ?", parameters)
+
+    def _insert(self, instances: list, relops: list, objects: list, columns: list) -> None:
+        for table, rows in (
+            ("instances", instances),
+            ("relops", relops),
+            ("objects", objects),
+            ("columns", columns),
+        ):
+            if rows:
+                placeholders = ", ".join("?" * len(rows[0]))
+                self.connection.executemany(
+                    f"INSERT INTO {table} VALUES ({placeholders})", rows
+                )
+
+    def load_split(self, split: str) -> int:
+        from lxml import etree
+
+        from .ep_parser import parse
+        from .ep_reader import read
+
+        instances = read(split)
+        return self.load(
+            split, ((ins, parse(etree.fromstring(ins["ep"]))) for ins in instances)
+        )
+
+    def sync_split(self, split: str) -> Tuple[int, int]:
+        """Updates `split` from the dataset, returning the instances added and removed.
+
+        Instances are matched by content hash, so only new and changed
+        instances are parsed and inserted. Instances that merely moved within
+        the split keep their rows.
+        """
+        from lxml import etree
+
+        from .ep_parser import parse
+        from .ep_reader import read
+
+        stored: dict[str, list[Tuple[int, int]]] = {}
+        for instance_id, idx, content_hash in self.execute(
+            "SELECT id, idx, content_hash FROM instances WHERE split = ?", (split,)
+        ):
+            stored.setdefault(content_hash, []).append((instance_id, idx))
+        moved = []
+        new = []
+        for idx, instance in enumerate(read(split)):
+            matches = stored.get(instance_hash(instance))
+            if not matches:
+                new.append((idx, instance))
+                continue
+            instance_id, stored_idx = matches.pop()
+            if stored_idx != idx:
+                moved.append((idx, instance_id))
+        removed = [instance_id for matches in stored.values() for instance_id, _ in matches]
+        with self.connection:
+            self._delete_ids(removed)
+            # Moved instances go through negative indexes, as (split, idx) is unique.
+            self.connection.executemany(
+                "UPDATE instances SET idx = -1 - id WHERE id = ?", [(i,) for _, i in moved]
+            )
+            self.connection.executemany("UPDATE instances SET idx = ? WHERE id = ?", moved)
+            added = self._add(
+                split, ((idx, ins, parse(etree.fromstring(ins["ep"]))) for idx, ins in new)
+            )
+        self.connection.executescript(INDEXES)
+        return added, len(removed)
+
+    def execute(self, sql: str, parameters: Tuple = ()) -> list[tuple]:
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def _where(self, filters: dict) -> Tuple[str, list]:
+        unknown = set(filters) - set(FILTERS)
+        if unknown:
+            raise ValueError(
+                f"Unknown filters {sorted(unknown)}, expected some of {list(FILTERS)}."
+            )
+        conditions = [FILTERS[k] for k, v in filters.items() if v is not None]
+        parameters = [v for v in filters.values() if v is not None]
+        return " AND ".join(conditions) or "1", parameters
+
+    def relops(self, **filters) -> list[StoredRelOp]:
+        """The RelOps matching every filter in `FILTERS`, in plan order."""
+        where, parameters = self._where(filters)
+        rows = self.execute(
+            "SELECT i.split, i.idx, i.db_id, r.node, r.parent, r.depth, r.operation, "
+            "r.logical_op, r.physical_op, r.n_children "
+            "FROM relops r JOIN instances i ON i.id = r.instance_id "
+            f"WHERE {where} ORDER BY r.instance_id, r.node",
+            tuple(parameters),
+        )
+        return [StoredRelOp(*row) for row in rows]
+
+    def db_ids(self, **filters) -> list[str]:
+        """The db_ids with at least one RelOp matching the filters."""
+        where, parameters = self._where(filters)
+        rows = self.execute(
+            "SELECT DISTINCT i.db_id "
+            "FROM relops r JOIN instances i ON i.id = r.instance_id "
+            f"WHERE {where} ORDER BY i.db_id",
+            tuple(parameters),
+        )
+        return [row[0] for row in rows]
+
+    def operator_counts(self, **filters) -> dict[Tuple[str, str], int]:
+        """The number of RelOps matching the filters for each (LogicalOp, PhysicalOp)."""
+        where, parameters = self._where(filters)
+        rows = self.execute(
+            "SELECT r.logical_op, r.physical_op, COUNT(*) "
+            "FROM relops r JOIN instances i ON i.id = r.instance_id "
+            f"WHERE {where} GROUP BY r.logical_op, r.physical_op ORDER BY COUNT(*) DESC",
+            tuple(parameters),
+        )
+        return {(logical_op, physical_op): n for logical_op, physical_op, n in rows}
+
+    def tables(self, db_id: Optional[str] = None) -> dict[Tuple[str, str], int]:
+        """How many RelOps scan each (schema, table)."""
+        rows = self.execute(
+            "SELECT o.schema_name, o.table_name, COUNT(*) "
+            "FROM objects o JOIN instances i ON i.id = o.instance_id "
+            "WHERE ? IS NULL OR i.db_id = ? "
+            "GROUP BY o.schema_name, o.table_name ORDER BY COUNT(*) DESC",
+            (db_id, db_id),
+        )
+        return {(schema, table): n for schema, table, n in rows}
+
+    def __len__(self) -> int:
+        return self.execute("SELECT COUNT(*) FROM instances")[0][0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "PlanStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    with PlanStore(sys.argv[1] if len(sys.argv) > 1 else "plan_store.sqlite3") as store:
+        for split in ("train", "dev"):
+            start = time.perf_counter()
+            added, removed = store.sync_split(split)
+            print(
+                f"Added {added} and removed {removed} {split} instances "
+                f"in {time.perf_counter() - start:.2f}s."
+            )
+        start = time.perf_counter()
+        db_ids = store.db_ids(physical_op="Hash Match", min_children=4)
+        print(
+            f"{len(db_ids)} db_ids have Hash Match RelOps with more than 3 inputs "
+            f"({(time.perf_counter() - start) * 1000:.1f} ms)."
+        )
@@ -0,0 +1,506 @@
+"""Synthetic showplans for benchmarks and scale tests without the Spider dataset.
+
+`PlanGenerator` writes showplan XML in the `NS` namespace that `ep_parser`
+can parse, drawing from every (LogicalOp, PhysicalOp) pair in `OPERATORS`.
+Every plan has exactly `depth` levels of RelOps: the first child of a join or
+a concatenation carries the rest of the plan's depth and its other children
+are scans. Joins and concatenations are chosen with `branch_probability`,
+concatenations have `fan_out` inputs, predicates combine
+`predicate_complexity` comparisons with AND and OR, and compute scalars,
+aggregates, scans and concatenations define `defined_values` columns.
+
+Instance `i` of a generator is drawn from its own seed, so a corpus is the
+same whether it is generated in one process or several:
+
+    python -m spider_execution_plans.execution_plans.ep_synth <out_dir> --plans 1000000 --jobs 8
+"""
+
+import argparse
+import html
+import json
+import random
+
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from .ep_parser import NS
+
+LEAF_OPERATORS = (
+    ("Clustered Index Scan", "Clustered Index Scan"),
+    ("Clustered Index Seek", "Clustered Index Seek"),
+    ("Index Scan", "Index Scan"),
+    ("Index Seek", "Index Seek"),
+    ("RID Lookup", "RID Lookup"),
+    ("Table Scan", "Table Scan"),
+)
+UNARY_OPERATORS = (
+    ("Compute Scalar", "Compute Scalar"),
+    ("Aggregate", "Stream Aggregate"),
+    ("Sort", "Sort"),
+    ("Distinct Sort", "Sort"),
+    ("TopN Sort", "Sort"),
+    ("Filter", "Filter"),
+    ("Top", "Top"),
+    ("Aggregate", "Hash Match"),
+    ("Lazy Spool", "Row Count Spool"),
+    ("Lazy Spool", "Table Spool"),
+)
+BRANCH_OPERATORS = (
+    ("Inner Join", "Nested Loops"),
+    ("Left Anti Semi Join", "Nested Loops"),
+    ("Left Semi Join", "Nested Loops"),
+    ("Union", "Merge Join"),
+    ("Inner Join", "Merge Join"),
+    ("Right Anti Semi Join", "Merge Join"),
+    ("Left Anti Semi Join", "Merge Join"),
+    ("Inner Join", "Hash Match"),
+    ("Right Anti Semi Join", "Hash Match"),
+    ("Concatenation", "Concatenation"),
+)
+OPERATORS = LEAF_OPERATORS + UNARY_OPERATORS + BRANCH_OPERATORS
+COMPARE_OPS = ("EQ", "GE", "GT", "LE", "LT", "NE")
+ARITHMETIC_OPS = ("ADD", "DIV", "SUB")
+AGG_TYPES = ("AVG", "COUNT_BIG", "MAX", "MIN", "SUM")
+DATA_TYPES = ("int", "float", "varchar")
+
+
+def element(tag: str, attributes: Optional[dict] = None, *children: str) -> str:
+    attrs = "".join(f' {k}="{html.escape(str(v))}"' for k, v in (attributes or {}).items())
+    if not children:
+        return f"<{tag}{attrs}/>"
+    return f"<{tag}{attrs}>{''.join(children)}</{tag}>"
+
+
+class PlanGenerator:
+    def __init__(
+        self,
+        depth: int = 6,
+        fan_out: int = 3,
+        branch_probability: float = 0.25,
+        predicate_complexity: int = 1,
+        defined_values: int = 2,
+        n_databases: int = 20,
+        n_tables: int = 8,
+        n_columns: int = 6,
+        seed: int = 0,
+    ):
+        assert depth >= 1, "Plans have at least one RelOp."
+        assert fan_out >= 2, "Concatenations have at least two inputs."
+        assert predicate_complexity >= 1, "Predicates have at least one comparison."
+        self.depth = depth
+        self.fan_out = fan_out
+        self.branch_probability = branch_probability
+        self.predicate_complexity = predicate_complexity
+        self.defined_values = defined_values
+        self.n_databases = n_databases
+        self.n_tables = n_tables
+        self.n_columns = n_columns
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.db_id = ""
+        self.node_id = 0
+        self.expr_id = 1000
+
+    def instance(self, i: int = 0) -> dict:
+        """Instance `i`, with the keys `ep_reader` and the harvester use."""
+        self.random.seed(self.seed * 2**32 + i)
+        self.db_id = f"db_{self.random.randrange(self.n_databases)}"
+        table = self.table()
+        query = f"SELECT * FROM {self.db_id}.{table} AS T1 WHERE T1.col_0 > {i}"
+        return {
+            "db_id": self.db_id,
+            "query": query,
+            "question": f"Synthetic question {i} about {table}?",
+            "ep": self.plan(query),
+        }
+
+    def plan(self, query: str) -> str:
+        self.node_id = 0
+        self.expr_id = 1000
+        relop, cost = self.relop(self.depth)
+        stmt = element(
+            "StmtSimple",
+            {
+                "StatementText": query,
+                "StatementId": 1,
+                "StatementType": "SELECT",
+                "StatementSubTreeCost": f"{cost:.6g}",
+            },
+            element("QueryPlan", None, relop),
+        )
+        return element(
+            "ShowPlanXML",
+            {"xmlns": NS, "Version": "1.5"},
+            element(
+                "BatchSequence",
+                None,
+                element("Batch", None, element("Statements", None, stmt)),
+            ),
+        )
+
+    def table(self) -> str:
+        return f"table_{self.random.randrange(self.n_tables)}"
+
+    def column(self, table: Optional[str] = None) -> str:
+        table = table or self.table()
+        return element(
+            "ColumnReference",
+            {
+                "Database": "[spider]",
+                "Schema": f"[{self.db_id}]",
+                "Table": f"[{table}]",
+                "Alias": "[T1]",
+                "Column": f"col_{self.random.randrange(self.n_columns)}",
+            },
+        )
+
+    def expression_column(self, prefix: str = "Expr") -> str:
+        self.expr_id += 1
+        return element("ColumnReference", {"Column": f"{prefix}{self.expr_id}"})
+
+    def scalar(self, child: str) -> str:
+        return element("ScalarOperator", None, child)
+
+    def identifier(self, table: Optional[str] = None) -> str:
+        return self.scalar(element("Identifier", None, self.column(table)))
+
+    def const(self) -> str:
+        r = self.random.random()
+        if r < 0.5:
+            value = f"({self.random.randrange(100)})"
+        elif r < 0.75:
+            value = f"({self.random.random() * 100:.6e})"
+        else:
+            value = f"N'value {self.random.randrange(100)}'"
+        return self.scalar(element("Const", {"ConstValue": value}))
+
+    def operand(self) -> str:
+        r = self.random.random()
+        if r < 0.5:
+            return self.identifier()
+        if r < 0.75:
+            return self.const()
+        if r < 0.875:
+            return self.convert(self.identifier())
+        return self.arithmetic()
+
+    def convert(self, operand: str) -> str:
+        attributes = {
+            "DataType": self.random.choice(DATA_TYPES),
+            "Style": "0",
+            "Implicit": self.random.choice("01"),
+        }
+        return self.scalar(element("Convert", attributes, operand))
+
+    def arithmetic(self) -> str:
+        attributes = {"Operation": self.random.choice(ARITHMETIC_OPS)}
+        return self.scalar(element("Arithmetic", attributes, self.identifier(), self.const()))
+
+    def comparison(self) -> str:
+        if self.random.random() < 0.15:
+            pattern = self.scalar(element("Const", {"ConstValue": "N'%a%'"}))
+            return self.scalar(
+                element("Intrinsic", {"FunctionName": "like"}, self.identifier(), pattern)
+            )
+        attributes = {"CompareOp": self.random.choice(COMPARE_OPS)}
+        return self.scalar(element("Compare", attributes, self.operand(), self.operand()))
+
+    def condition(self, comparisons: int) -> str:
+        if comparisons == 1:
+            return self.comparison()
+        left = self.random.randint(1, comparisons - 1)
+        return self.scalar(
+            element(
+                "Logical",
+                {"Operation": self.random.choice(("AND", "OR"))},
+                self.condition(left),
+                self.condition(comparisons - left),
+            )
+        )
+
+    def predicate(self) -> str:
+        return element("Predicate", None, self.condition(self.predicate_complexity))
+
+    def expression(self) -> str:
+        r = self.random.random()
+        if r < 0.4:
+            return self.arithmetic()
+        if r < 0.7:
+            return self.convert(self.identifier())
+        if r < 0.9:
+            return self.scalar(
+                element(
+                    "IF",
+                    None,
+                    element("Condition", None, self.comparison()),
+                    element("Then", None, self.const()),
+                    element("Else", None, self.identifier()),
+                )
+            )
+        return self.identifier()
+
+    def aggregate(self) -> str:
+        if self.random.random() < 0.3:
+            attributes = {"AggType": "countstar", "Distinct": "false"}
+            return self.scalar(element("Aggregate", attributes))
+        attributes = {
+            "AggType": self.random.choice(AGG_TYPES),
+            "Distinct": self.random.choice(("true", "false")),
+        }
+        return self.scalar(element("Aggregate", attributes, self.identifier()))
+
+    def computed_values(self, value) -> str:
+        values = [
+            element("DefinedValue", None, self.expression_column(), value())
+            for _ in range(self.defined_values)
+        ]
+        return element("DefinedValues", None, *values)
+
+    def scanned_values(self, table: str) -> str:
+        values = [
+            element("DefinedValue", None, self.column(table)) for _ in range(self.defined_values)
+        ]
+        return element("DefinedValues", None, *values)
+
+    def order_by(self) -> str:
+        columns = "".join(self.column() for _ in range(self.random.randint(1, 2)))
+        ascending = self.random.choice("01")
+        order_by_column = element("OrderByColumn", {"Ascending": ascending}, columns)
+        return element("OrderBy", None, order_by_column)
+
+    def object(self, table: str, index: Optional[str]) -> str:
+        attributes = {
+            "Database": "[spider]",
+            "Schema": f"[{self.db_id}]",
+            "Table": f"[{table}]",
+            "Alias": "[T1]",
+        }
+        if index is not None:
+            attributes["Index"] = index
+        return element("Object", attributes)
+
+    def scan_range(self, tag: str, scan_type: str, table: str) -> str:
+        return element(
+            tag,
+            {"ScanType": scan_type},
+            element("RangeColumns", None, self.column(table)),
+            element("RangeExpressions", None, self.operand()),
+        )
+
+    def seek_predicate(self, table: str) -> str:
+        if self.random.random() < 0.6:
+            keys = [self.scan_range("Prefix", "EQ", table)]
+        else:
+            keys = [
+                self.scan_range("StartRange", self.random.choice(("GE", "GT")), table),
+                self.scan_range("EndRange", self.random.choice(("LE", "LT")), table),
+            ]
+        return element(
+            "SeekPredicates",
+            None,
+            element("SeekPredicateNew", None, element("SeekKeys", None, *keys)),
+        )
+
+    def relop(self, depth: int) -> Tuple[str, float]:
+        if depth == 1:
+            logical_op, physical_op = self.random.choice(LEAF_OPERATORS)
+        elif self.random.random() < self.branch_probability:
+            logical_op, physical_op = self.random.choice(BRANCH_OPERATORS)
+        else:
+            logical_op, physical_op = self.random.choice(UNARY_OPERATORS)
+        node_id = self.node_id
+        self.node_id += 1
+        output_list = "".join(self.column() for _ in range(self.random.randint(1, 3)))
+        operation, children_cost = self.operation(logical_op, physical_op, depth)
+        io = self.random.random() * 0.01
+        cpu = self.random.random() * 0.001
+        cost = children_cost + io + cpu
+        relop = element(
+            "RelOp",
+            {
+                "NodeId": node_id,
+                "PhysicalOp": physical_op,
+                "LogicalOp": logical_op,
+                "EstimateRows": self.random.randint(1, 10000),
+                "EstimateIO": f"{io:.6g}",
+                "EstimateCPU": f"{cpu:.6g}",
+                "AvgRowSize": self.random.randint(9, 200),
+                "EstimatedTotalSubtreeCost": f"{cost:.6g}",
+                "Parallel": "0",
+            },
+            element("OutputList", None, output_list),
+            operation,
+        )
+        return relop, cost
+
+    def children(self, depth: int, n: int) -> Tuple[list[str], float]:
+        """The full-depth first child and `n - 1` scans, with their total cost."""
+        first, cost = self.relop(depth - 1)
+        children = [first]
+        for _ in range(n - 1):
+            child, child_cost = self.relop(1)
+            children.append(child)
+            cost += child_cost
+        return children, cost
+
+    def operation(self, logical_op: str, physical_op: str, depth: int) -> Tuple[str, float]:
+        """The operation element of a RelOp and the total cost of its children."""
+        if depth == 1:
+            return self.scan(logical_op), 0.0
+        if physical_op == "Concatenation":
+            children, cost = self.children(depth, self.fan_out)
+            values = [
+                element(
+                    "DefinedValue",
+                    None,
+                    self.expression_column("Union"),
+                    *(self.column() for _ in children),
+                )
+                for _ in range(self.defined_values)
+            ]
+            values = element("DefinedValues", None, *values)
+            return element("Concat", None, values, *children), cost
+        if (logical_op, physical_op) in BRANCH_OPERATORS:
+            children, cost = self.children(depth, 2)
+            return self.join(logical_op, physical_op, children), cost
+        (child,), cost = self.children(depth, 1)
+        if physical_op == "Compute Scalar":
+            values = self.computed_values(self.expression)
+            return element("ComputeScalar", None, values, child), cost
+        if physical_op == "Stream Aggregate":
+            values = self.computed_values(self.aggregate)
+            group_by = element("GroupBy", None, self.column())
+            return element("StreamAggregate", None, values, group_by, child), cost
+        if physical_op == "Hash Match":
+            values = self.computed_values(self.aggregate)
+            return element("Hash", None, values, child), cost
+        if logical_op == "TopN Sort":
+            attributes = {"Distinct": "0", "Rows": self.random.randint(1, 100)}
+            return element("TopSort", attributes, self.order_by(), child), cost
+        if physical_op == "Sort":
+            attributes = {"Distinct": "1" if logical_op == "Distinct Sort" else "0"}
+            return element("Sort", attributes, self.order_by(), child), cost
+        if physical_op == "Filter":
+            return element("Filter", {"StartupExpression": "0"}, child, self.predicate()), cost
+        if physical_op == "Top":
+            expression = element("TopExpression", None, self.const())
+            attributes = {"RowCount": "0", "IsPercent": "0", "WithTies": "0"}
+            return element("Top", attributes, expression, child), cost
+        if physical_op == "Row Count Spool":
+            return element("RowCountSpool", None, child), cost
+        if physical_op == "Table Spool":
+            return element("Spool", None, child), cost
+        raise ValueError(f"({logical_op}, {physical_op}) is not generated.")
+
+    def join(self, logical_op: str, physical_op: str, children: list[str]) -> str:
+        if physical_op == "Nested Loops":
+            predicate = [self.predicate()] if self.random.random() < 0.5 else []
+            return element("NestedLoops", {"Optimized": "0"}, *predicate, *children)
+        if physical_op == "Merge Join":
+            columns = []
+            if logical_op != "Union":
+                columns = [
+                    element("InnerSideJoinColumns", None, self.column()),
+                    element("OuterSideJoinColumns", None, self.column()),
+                ]
+            return element("Merge", {"ManyToMany": "0"}, *columns, *children)
+        return element("Hash", None, *children)
+
+    def scan(self, logical_op: str) -> str:
+        table = self.table()
+        values = self.scanned_values(table)
+        if logical_op == "Table Scan":
+            predicate = [self.predicate()] if self.random.random() < 0.5 else []
+            obj = self.object(table, None)
+            return element("TableScan", {"Ordered": "0"}, values, obj, *predicate)
+        if logical_op == "RID Lookup":
+            return element(
+                "IndexScan",
+                {"Lookup": "1", "Ordered": "true"},
+                values,
+                self.object(table, None),
+                self.seek_predicate(table),
+            )
+        seek = logical_op.endswith("Seek")
+        kind = "PK" if logical_op.startswith("Clustered") else "IX"
+        children = [values, self.object(table, f"[{kind}__{table}]")]
+        if seek:
+            children.append(self.seek_predicate(table))
+        if self.random.random() < 0.5:
+            children.append(self.predicate())
+        return element("IndexScan", {"Ordered": "true" if seek else "false"}, *children)
+
+
+def iter_instances(n: int, jobs: int = 1, **options) -> Iterator[dict]:
+    """Generates `n` instances in order, in `jobs` processes if more than one."""
+    generator = PlanGenerator(**options)
+    if jobs <= 1:
+        return map(generator.instance, range(n))
+    return _iter_pool(generator, n, jobs)
+
+
+def _iter_pool(generator: PlanGenerator, n: int, jobs: int) -> Iterator[dict]:
+    from multiprocessing import Pool
+
+    with Pool(jobs) as pool:
+        yield from pool.imap(generator.instance, range(n), chunksize=256)
+
+
+def generate(n: int, depth: int = 6, seed: int = 0, **options) -> list[dict]:
+    return list(iter_instances(n, depth=depth, seed=seed, **options))
+
+
+def write_dataset(instances: Iterable[dict], path: Union[str, Path]) -> int:
+    """Writes instances as a JSON list, or as `PlanWriter` JSON Lines for a `.jsonl` path."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    if path.suffix == ".jsonl":
+        from ..plan_writer import PlanWriter
+
+        with PlanWriter(path, checkpoint_every=10000) as writer:
+            for n, instance in enumerate(instances, start=1):
+                writer.write(n - 1, instance)
+        return n
+    with open(path, mode="w", encoding="utf-8") as f:
+        f.write("[")
+        for n, instance in enumerate(instances, start=1):
+            if n > 1:
+                f.write(",\n")
+            json.dump(instance, f)
+        f.write("]\n")
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Spider-like dataset.")
+    parser.add_argument("out_dir", help="Directory for <split>_spider_with_ep.json(l).")
+    parser.add_argument("--plans", type=int, default=7000, help="Number of train plans.")
+    parser.add_argument("--dev-plans", type=int, default=1034)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--fan-out", type=int, default=3)
+    parser.add_argument("--branch-probability", type=float, default=0.25)
+    parser.add_argument("--predicate-complexity", type=int, default=1)
+    parser.add_argument("--defined-values", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0, help="The dev split uses seed + 1.")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--jsonl", action="store_true", help="Write JSON Lines instead of JSON.")
+    args = parser.parse_args()
+
+    options = dict(
+        depth=args.depth,
+        fan_out=args.fan_out,
+        branch_probability=args.branch_probability,
+        predicate_complexity=args.predicate_complexity,
+        defined_values=args.defined_values,
+    )
+    suffix = ".jsonl" if args.jsonl else ".json"
+    splits = (("train", args.plans, args.seed), ("dev", args.dev_plans, args.seed + 1))
+    for split, n, seed in splits:
+        path = Path(args.out_dir) / f"{split}_spider_with_ep{suffix}"
+        n = write_dataset(iter_instances(n, args.jobs, seed=seed, **options), path)
+        print(f"Wrote {n} {split} instances to {path}.")
+
+
+if __name__ == "__main__":
+    main()
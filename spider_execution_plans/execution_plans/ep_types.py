@@ -480,9 +480,40 @@ class RelOp:
     operation: RelOpType
     output_list: list[ColumnReference]
     defined_values: list[DefinedValue] = field(default_factory=list)
+    node_id: Optional[int] = None
+    logical_op: Optional[str] = None
+    physical_op: Optional[str] = None
+    estimate_rows: Optional[float] = None
+    estimate_cpu: Optional[float] = None
+    estimate_io: Optional[float] = None
+    avg_row_size: Optional[int] = None
+    estimated_total_subtree_cost: Optional[float] = None
+    parallel: Optional[bool] = None
+
+    def __reduce_ex__(self, protocol):
+        from .ep_pickle import reduce
+
+        return reduce(self, protocol)
+
+
+def child_relops(relop: RelOp) -> list[RelOp]:
+    op = relop.operation
+    if hasattr(op, "relop"):
+        return [op.relop]
+    if hasattr(op, "relops"):
+        return op.relops
+    if hasattr(op, "left"):
+        return [op.left, op.right]
+    return []
 
 
 @dataclass(frozen=True)
 class ExecutionPlan:
     query: str
     relop: RelOp
+    statement_subtree_cost: Optional[float] = None
+
+    def __reduce_ex__(self, protocol):
+        from .ep_pickle import reduce
+
+        return reduce(self, protocol)
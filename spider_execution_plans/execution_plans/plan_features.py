@@ -0,0 +1,143 @@
+"""Hashed sparse feature matrices of execution plans for quick baselines.
+
+Every plan is described by a bag of operators, a bag of (parent, child)
+operator edges and a bag of the tables it scans. Each feature is hashed with
+CRC-32 into one of `n_features` columns of a CSR matrix.
+"""
+
+import hashlib
+import zlib
+
+from array import array
+from functools import lru_cache
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+import scipy.sparse
+
+from .ep_types import *
+from .plan_to_tensors import relop_token
+
+Chunk = Tuple[array, array]
+
+
+class PlanFeaturizer:
+    def __init__(
+        self,
+        n_features: int = 2**18,
+        operators: bool = True,
+        edges: bool = True,
+        tables: bool = True,
+    ):
+        self.n_features = n_features
+        self.operators = operators
+        self.edges = edges
+        self.tables = tables
+        self.column = lru_cache(maxsize=None)(self._column)
+
+    def __repr__(self):
+        return (
+            f"PlanFeaturizer(n_features={self.n_features}, operators={self.operators}, "
+            f"edges={self.edges}, tables={self.tables})"
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["column"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.column = lru_cache(maxsize=None)(self._column)
+
+    def _column(self, feature: str) -> int:
+        return zlib.crc32(feature.encode("utf-8")) % self.n_features
+
+    def features(self, ep: ExecutionPlan) -> list[str]:
+        result = []
+        stack = [(ep.relop, None)]
+        while stack:
+            relop, parent_token = stack.pop()
+            token = relop_token(relop)
+            if self.operators:
+                result.append(f"op={token}")
+            if self.edges and parent_token is not None:
+                result.append(f"edge={parent_token}>{token}")
+            obj = getattr(relop.operation, "obj", None)
+            if self.tables and obj is not None:
+                result.append(f"table={obj.schema}.{obj.table}")
+            stack.extend((child, token) for child in child_relops(relop))
+        return result
+
+    def _transform_chunk(self, eps: Sequence[ExecutionPlan]) -> Chunk:
+        indices = array("q")
+        row_lengths = array("q")
+        for ep in eps:
+            columns = [self.column(f) for f in self.features(ep)]
+            indices.extend(columns)
+            row_lengths.append(len(columns))
+        return indices, row_lengths
+
+    def fit(self, eps: Sequence[ExecutionPlan] = None) -> "PlanFeaturizer":
+        return self
+
+    def transform(
+        self, eps: Sequence[ExecutionPlan], n_jobs: int = 1, chunk_size: int = 512
+    ) -> scipy.sparse.csr_matrix:
+        chunks = [eps[i : i + chunk_size] for i in range(0, len(eps), chunk_size)]
+        if n_jobs > 1 and len(chunks) > 1:
+            with Pool(n_jobs) as pool:
+                results = pool.map(self._transform_chunk, chunks)
+        else:
+            results = [self._transform_chunk(chunk) for chunk in chunks]
+        indices = np.concatenate(
+            [np.frombuffer(r[0], dtype=np.int64) for r in results] or [np.empty(0, np.int64)]
+        )
+        row_lengths = np.concatenate(
+            [np.frombuffer(r[1], dtype=np.int64) for r in results] or [np.empty(0, np.int64)]
+        )
+        indptr = np.zeros(len(row_lengths) + 1, dtype=np.int64)
+        np.cumsum(row_lengths, out=indptr[1:])
+        matrix = scipy.sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr),
+            shape=(len(row_lengths), self.n_features),
+        )
+        matrix.sum_duplicates()
+        return matrix
+
+    def fit_transform(
+        self, eps: Sequence[ExecutionPlan], n_jobs: int = 1
+    ) -> scipy.sparse.csr_matrix:
+        return self.fit(eps).transform(eps, n_jobs)
+
+
+def featurize_split(
+    split: str,
+    featurizer: Optional[PlanFeaturizer] = None,
+    cache_dir: Union[str, Path] = ".cache/features",
+    n_jobs: int = 1,
+) -> scipy.sparse.csr_matrix:
+    """Featurizes a dataset split, cached by the hash of its file and the featurizer."""
+    from .ep_reader import get_eps, source_path
+
+    featurizer = featurizer or PlanFeaturizer()
+    digest = hashlib.sha256(repr(featurizer).encode("utf-8"))
+    # The shard manifest holds the hash of every shard.
+    with open(source_path(split), mode="rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    cache_path = Path(cache_dir) / f"{split}-{digest.hexdigest()[:16]}.npz"
+    if cache_path.exists():
+        return scipy.sparse.load_npz(cache_path)
+    matrix = featurizer.transform(get_eps(split), n_jobs)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    scipy.sparse.save_npz(cache_path, matrix)
+    return matrix
+
+
+if __name__ == "__main__":
+    for split in ("train", "dev"):
+        matrix = featurize_split(split, n_jobs=4)
+        print(f"{split}: {matrix.shape[0]} plans, {matrix.nnz} non-zero features")
@@ -1,6 +1,9 @@
-from typing import Callable
+from __future__ import annotations
 
-import graphviz
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    import graphviz
 
 from .ep_types import *
 
@@ -50,12 +53,13 @@ node2indexer: dict[str, Callable[[], str]] = {
 }
 
 
-def draw_execution_plan(
+def build_execution_plan_graph(
     parsed_ep: ExecutionPlan,
     graph_name: str = "ExecutionPlan",
-    save_dir: Optional[str] = None,
     format_: Optional[str] = None,
-) -> None:
+) -> graphviz.Digraph:
+    import graphviz
+
     dot = graphviz.Digraph(
         name=graph_name,
         format=format_,
@@ -71,6 +75,16 @@ def draw_execution_plan(
     root = "SELECT"
     dot.node(root)
     draw_relop(parsed_ep.relop, root, dot)
+    return dot
+
+
+def draw_execution_plan(
+    parsed_ep: ExecutionPlan,
+    graph_name: str = "ExecutionPlan",
+    save_dir: Optional[str] = None,
+    format_: Optional[str] = None,
+) -> None:
+    dot = build_execution_plan_graph(parsed_ep, graph_name, format_)
     if save_dir:
         dot.render(directory=save_dir)
     else:
@@ -0,0 +1,232 @@
+"""Export execution plans as graph tensors for graph neural networks.
+
+Each split is written as a bundle of `.npy` files, with one row per node in
+pre-order and the nodes of all plans concatenated:
+
+- `node_type`: int32 ids into the vocabulary in `vocab.json`
+- `node_costs`: float32 optimizer estimates (see `ep_stats.COST_FIELDS`), NaN for scalar operators
+- `edge_index`: int32 (2, E) parent -> child edges between global node ids
+- `edge_type`: uint8 0 for RelOp -> RelOp edges, 1 for edges to scalar operators
+- `node_ptr`, `edge_ptr`: int64 offsets of the nodes and edges of each plan
+"""
+
+import json
+
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Sequence, Union, get_args
+
+import numpy as np
+
+from .ep_stats import COST_FIELDS
+from .ep_types import *
+
+RELOP_EDGE = 0
+SCALAR_EDGE = 1
+SCALAR_TYPES = get_args(ScalarOperator)
+CONTAINER_TYPES = (DefinedValue, SeekPredicate, ScanRange)
+ARRAYS = ("node_type", "node_costs", "edge_index", "edge_type", "node_ptr", "edge_ptr")
+NO_COSTS = (float("nan"),) * len(COST_FIELDS)
+
+
+def relop_token(relop: RelOp) -> str:
+    if relop.physical_op is not None:
+        return f"{relop.logical_op}/{relop.physical_op}"
+    return type(relop.operation).__name__
+
+
+def scalar_token(x: ScalarOperator) -> str:
+    name = type(x).__name__
+    if isinstance(x, Aggregate):
+        return f"{name}:{x.agg_type}"
+    if isinstance(x, (Arithmetic, Logical)):
+        return f"{name}:{x.operation}"
+    if isinstance(x, Compare):
+        return f"{name}:{x.compare_op}"
+    if isinstance(x, Intrinsic):
+        return f"{name}:{x.function_name}"
+    if isinstance(x, Convert):
+        return f"{name}:{x.data_type}"
+    return name
+
+
+def scalar_children(obj) -> list[ScalarOperator]:
+    """The outermost scalar operators in the fields of `obj`, not crossing into RelOps."""
+    result = []
+    stack = [getattr(obj, f.name) for f in reversed(fields(obj))]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, SCALAR_TYPES):
+            result.append(value)
+        elif isinstance(value, list):
+            stack.extend(reversed(value))
+        elif isinstance(value, CONTAINER_TYPES):
+            stack.extend(getattr(value, f.name) for f in reversed(fields(value)))
+    return result
+
+
+class GraphExporter:
+    """Accumulates the node and edge arrays of many plans with a shared vocabulary."""
+
+    def __init__(self, vocab: dict[str, int], scalar_edges: bool = True):
+        self.vocab = vocab
+        self.scalar_edges = scalar_edges
+        self.node_type = []
+        self.node_costs = []
+        self.src = []
+        self.dst = []
+        self.edge_type = []
+        self.node_ptr = [0]
+        self.edge_ptr = [0]
+
+    def add(self, ep: ExecutionPlan) -> None:
+        vocab = self.vocab
+        stack = [(ep.relop, -1, RELOP_EDGE)]
+        while stack:
+            node, parent, edge_type = stack.pop()
+            idx = len(self.node_type)
+            if parent >= 0:
+                self.src.append(parent)
+                self.dst.append(idx)
+                self.edge_type.append(edge_type)
+            if isinstance(node, RelOp):
+                token = relop_token(node)
+                self.node_costs.append(tuple(getattr(node, f) for f in COST_FIELDS))
+                children = [(c, idx, RELOP_EDGE) for c in child_relops(node)]
+                if self.scalar_edges:
+                    children += [
+                        (c, idx, SCALAR_EDGE) for c in scalar_children(node.operation)
+                    ]
+            else:
+                token = scalar_token(node)
+                self.node_costs.append(NO_COSTS)
+                children = [(c, idx, SCALAR_EDGE) for c in scalar_children(node)]
+            self.node_type.append(vocab.setdefault(token, len(vocab)))
+            stack.extend(reversed(children))
+        self.node_ptr.append(len(self.node_type))
+        self.edge_ptr.append(len(self.src))
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "node_type": np.array(self.node_type, dtype=np.int32),
+            "node_costs": np.array(self.node_costs, dtype=np.float32).reshape(
+                -1, len(COST_FIELDS)
+            ),
+            "edge_index": np.array([self.src, self.dst], dtype=np.int32).reshape(2, -1),
+            "edge_type": np.array(self.edge_type, dtype=np.uint8),
+            "node_ptr": np.array(self.node_ptr, dtype=np.int64),
+            "edge_ptr": np.array(self.edge_ptr, dtype=np.int64),
+        }
+
+
+def export_graphs(
+    splits: dict[str, Sequence[ExecutionPlan]],
+    out_dir: Union[str, Path],
+    scalar_edges: bool = True,
+) -> dict[str, int]:
+    """Writes one bundle per split into `out_dir` and returns the vocabulary."""
+    out_dir = Path(out_dir)
+    vocab: dict[str, int] = {}
+    for split_name, eps in splits.items():
+        exporter = GraphExporter(vocab, scalar_edges)
+        for ep in eps:
+            exporter.add(ep)
+        split_dir = out_dir / split_name
+        split_dir.mkdir(parents=True, exist_ok=True)
+        for name, array in exporter.arrays().items():
+            np.save(split_dir / f"{name}.npy", array)
+    with open(out_dir / "vocab.json", mode="w", encoding="utf-8") as f:
+        json.dump(vocab, f, indent=2)
+    return vocab
+
+
+@dataclass(frozen=True)
+class GraphBatch:
+    node_type: np.ndarray
+    node_costs: np.ndarray
+    edge_index: np.ndarray
+    edge_type: np.ndarray
+    batch: np.ndarray
+    ptr: np.ndarray
+
+    @property
+    def num_graphs(self) -> int:
+        return len(self.ptr) - 1
+
+
+@dataclass(frozen=True)
+class GraphBundle:
+    node_type: np.ndarray
+    node_costs: np.ndarray
+    edge_index: np.ndarray
+    edge_type: np.ndarray
+    node_ptr: np.ndarray
+    edge_ptr: np.ndarray
+    vocab: dict[str, int]
+
+    def __len__(self) -> int:
+        return len(self.node_ptr) - 1
+
+    def batch(self, start: int, stop: int) -> GraphBatch:
+        """Plans `start` to `stop`. Node arrays are views into the memory map."""
+        n0, n1 = self.node_ptr[start], self.node_ptr[stop]
+        e0, e1 = self.edge_ptr[start], self.edge_ptr[stop]
+        ptr = self.node_ptr[start : stop + 1] - n0
+        return GraphBatch(
+            node_type=self.node_type[n0:n1],
+            node_costs=self.node_costs[n0:n1],
+            edge_index=self.edge_index[:, e0:e1] - np.int32(n0),
+            edge_type=self.edge_type[e0:e1],
+            batch=np.repeat(np.arange(stop - start, dtype=np.int64), np.diff(ptr)),
+            ptr=ptr,
+        )
+
+    def collate(self, graph_ids: Sequence[int]) -> GraphBatch:
+        """Plans in any order. A contiguous range of ids is sliced without copying."""
+        graph_ids = np.asarray(graph_ids, dtype=np.int64)
+        if len(graph_ids) and np.all(np.diff(graph_ids) == 1):
+            return self.batch(int(graph_ids[0]), int(graph_ids[-1]) + 1)
+        node_starts = self.node_ptr[graph_ids]
+        node_counts = self.node_ptr[graph_ids + 1] - node_starts
+        edge_starts = self.edge_ptr[graph_ids]
+        edge_counts = self.edge_ptr[graph_ids + 1] - edge_starts
+        node_idx = _ranges(node_starts, node_counts)
+        edge_idx = _ranges(edge_starts, edge_counts)
+        ptr = np.concatenate([[0], np.cumsum(node_counts)])
+        # Moves every edge from its plan's offset in the bundle to its offset in the batch.
+        shift = np.repeat(ptr[:-1] - node_starts, edge_counts)
+        return GraphBatch(
+            node_type=self.node_type[node_idx],
+            node_costs=self.node_costs[node_idx],
+            edge_index=(self.edge_index[:, edge_idx] + shift).astype(np.int32),
+            edge_type=self.edge_type[edge_idx],
+            batch=np.repeat(np.arange(len(graph_ids), dtype=np.int64), node_counts),
+            ptr=ptr,
+        )
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenation of `arange(s, s + c)` for every start and count."""
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+    return np.arange(counts.sum()) + offsets
+
+
+def load_graphs(out_dir: Union[str, Path], split_name: str) -> GraphBundle:
+    out_dir = Path(out_dir)
+    with open(out_dir / "vocab.json", encoding="utf-8") as f:
+        vocab = json.load(f)
+    arrays = {
+        name: np.load(out_dir / split_name / f"{name}.npy", mmap_mode="r")
+        for name in ARRAYS
+    }
+    return GraphBundle(vocab=vocab, **arrays)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from .ep_reader import get_train_dev_eps
+
+    train, dev = get_train_dev_eps()
+    vocab = export_graphs({"train": train, "dev": dev}, sys.argv[1])
+    print(f"Exported {len(train)} train and {len(dev)} dev plans, {len(vocab)} node types.")
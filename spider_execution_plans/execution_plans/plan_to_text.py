@@ -6,6 +6,10 @@ Environment = dict[str, Any]
 IGNORED_NODES = (NestedLoops, ComputeScalar, Spool)
 
 
+class UnsupportedPlanError(ValueError):
+    """The plan has an operator or expression that cannot be rendered as text yet."""
+
+
 def apply_env(v: str, env: Environment):
     while v.startswith("Expr"):
         v = env[v]
@@ -61,7 +65,7 @@ def relop_to_text(relop: RelOp, env: Environment) -> list[Instruction]:
     elif isinstance(relop.operation, Spool):
         instructions = spool_to_text(relop.operation, env)
     else:
-        raise ValueError(f"{type(relop.operation).__class__.__name__} does not exist.")
+        raise UnsupportedPlanError(f"{type(relop.operation).__name__} does not exist.")
 
     if relop.output_list and not isinstance(relop.operation, IGNORED_NODES):
         last_ins = instructions[-1]
@@ -111,7 +115,7 @@ def stream_aggregate_to_text(x: StreamAggregate, env: Environment) -> list[Instr
         elif agg_type == "SUM":
             stream_agg_instructions.append(f"sum the rows of {column}")
         else:
-            raise ValueError(
+            raise UnsupportedPlanError(
                 f"Aggregate function {agg_type} not seen in train or dev sets"
             )
     if len(stream_agg_instructions) > 1:
@@ -196,7 +200,7 @@ def top_sort_to_text(x: TopSort, env: Environment) -> list[Instruction]:
 def top_to_text(x: Top, env: Environment) -> list[Instruction]:
     instructions = relop_to_text(x.relop, env)
     instruction = Instruction(
-        text=f"Take the top {scalar_operator_to_text(x.top_expression)} rows.",
+        text=f"Take the top {scalar_operator_to_text(x.top_expression, env)} rows.",
         idx=env["idx"],
     )
     env["idx"] += 1
@@ -226,27 +230,15 @@ def table_scan_to_text(x: TableScan, env: Environment) -> list[Instruction]:
 
 
 def hash_to_text(x: Hash, env: Environment) -> list[Instruction]:
-    assert len(x.relops) in (1, 2)
-    if len(x.relops) == 2:
-        left, right = x.relops
-        left_ins = relop_to_text(left, env)
-        left_idx = env["idx"] - 1
-        right_ins = relop_to_text(right, env)
-        right_idx = env["idx"] - 1
-    else:  # len(x.relops) == 1
-        pass
+    raise UnsupportedPlanError("Hash Match is not rendered yet.")
 
 
 def concat_to_text(x: Concat, env: Environment) -> list[Instruction]:
-    instructions = [ins for relop in x.relops for ins in relop_to_text(relop, env)]
-    instruction = "Concatenate the outputs of the previous {insno} nodes."
-    return instructions + [instruction]
+    raise UnsupportedPlanError("Concatenation is not rendered yet.")
 
 
 def row_count_spool_to_text(x: RowCountSpool, env: Environment) -> list[Instruction]:
-    instructions = relop_to_text(x.relop, env)
-    instruction = f"Count the number of rows in {env['idx']}."
-    return instructions + [instruction]
+    raise UnsupportedPlanError("Row Count Spool is not rendered yet.")
 
 
 def spool_to_text(x: Spool, env: Environment) -> list[Instruction]:
@@ -270,16 +262,12 @@ def scalar_operator_to_text(x: ScalarOperator, env: Environment):
         return str(x.const_value)
     elif isinstance(x, Convert):
         return scalar_operator_to_text(x.scalar_operator, env)
-    elif isinstance(x, If):
-        pass
     elif isinstance(x, Identifier):
         return x.column_reference.column
-    elif isinstance(x, Intrinsic):
-        pass
-    elif isinstance(x, Logical):
-        pass
+    elif isinstance(x, (If, Intrinsic, Logical)):
+        raise UnsupportedPlanError(f"{type(x).__name__} expressions are not rendered yet.")
     else:
-        raise ValueError(f"{type(x).__class__.__name__} does not exist.")
+        raise UnsupportedPlanError(f"{type(x).__name__} does not exist.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+"""Linearize execution plans into token sequences for sequence-to-sequence models.
+
+A plan is written in pre-order. Every RelOp opens with `(` and its
+operator, followed by the object it scans, the tokens of its scalar
+expressions (operators, columns and constants) and its children, and closes
+with `)`.
+
+Encoded splits are stored as a packed int32 `<split>.tokens.npy` array with
+`<split>.offsets.npy` marking where each plan starts, next to `vocab.json`.
+"""
+
+import json
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .ep_types import *
+from .plan_to_tensors import relop_token, scalar_children, scalar_token
+
+PAD = "<pad>"
+UNK = "<unk>"
+SPECIAL_TOKENS = (PAD, UNK)
+
+
+def linearize(ep: ExecutionPlan, output_columns: bool = False) -> list[str]:
+    tokens = []
+    stack = [ep.relop]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            tokens.append(node)
+        elif isinstance(node, RelOp):
+            tokens.append("(")
+            tokens.append(relop_token(node))
+            obj = getattr(node.operation, "obj", None)
+            if obj is not None:
+                tokens.append(f"{obj.schema}.{obj.table}")
+            if output_columns:
+                tokens.extend(map(str, node.output_list))
+            stack.append(")")
+            stack.extend(reversed(child_relops(node)))
+            stack.extend(reversed(scalar_children(node.operation)))
+        elif isinstance(node, Identifier):
+            tokens.append(str(node.column_reference))
+        elif isinstance(node, Const):
+            tokens.append(str(node.const_value))
+        else:
+            tokens.append(scalar_token(node))
+            stack.extend(reversed(scalar_children(node)))
+    return tokens
+
+
+def build_vocab(token_streams: Iterable[Sequence[str]]) -> dict[str, int]:
+    tokens = sorted({t for stream in token_streams for t in stream})
+    vocab = {t: i for i, t in enumerate(SPECIAL_TOKENS)}
+    for t in tokens:
+        vocab.setdefault(t, len(vocab))
+    return vocab
+
+
+def encode(
+    token_streams: Sequence[Sequence[str]], vocab: dict[str, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the packed token ids of all streams and the offsets of each stream."""
+    lengths = np.fromiter(map(len, token_streams), dtype=np.int64, count=len(token_streams))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    flat = np.array([t for stream in token_streams for t in stream], dtype=object)
+    # Only the distinct tokens are looked up in the vocabulary.
+    distinct, inverse = np.unique(flat.astype(str), return_inverse=True)
+    unk = vocab[UNK]
+    lookup = np.array([vocab.get(t, unk) for t in distinct], dtype=np.int32)
+    return lookup[inverse.reshape(-1)], offsets
+
+
+@dataclass(frozen=True)
+class TokenCorpus:
+    tokens: np.ndarray
+    offsets: np.ndarray
+    vocab: dict[str, int]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.tokens[self.offsets[i] : self.offsets[i + 1]]
+
+    def decode(self, ids: Iterable[int]) -> list[str]:
+        inverse = {i: t for t, i in self.vocab.items()}
+        return [inverse[i] for i in ids]
+
+
+def encode_splits(
+    splits: dict[str, Sequence[ExecutionPlan]],
+    out_dir: Union[str, Path],
+    vocab: Optional[dict[str, int]] = None,
+    output_columns: bool = False,
+) -> dict[str, int]:
+    """Writes every split into `out_dir`.
+
+    The vocabulary is read from `out_dir/vocab.json` if it exists, otherwise
+    it is built from all the splits and saved there.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    vocab_path = out_dir / "vocab.json"
+    streams = {
+        name: [linearize(ep, output_columns) for ep in eps] for name, eps in splits.items()
+    }
+    if vocab is None and vocab_path.exists():
+        with open(vocab_path, encoding="utf-8") as f:
+            vocab = json.load(f)
+    if vocab is None:
+        vocab = build_vocab(s for split in streams.values() for s in split)
+    with open(vocab_path, mode="w", encoding="utf-8") as f:
+        json.dump(vocab, f, indent=2)
+    for name, split_streams in streams.items():
+        tokens, offsets = encode(split_streams, vocab)
+        np.save(out_dir / f"{name}.tokens.npy", tokens)
+        np.save(out_dir / f"{name}.offsets.npy", offsets)
+    return vocab
+
+
+def load_tokens(out_dir: Union[str, Path], split_name: str) -> TokenCorpus:
+    out_dir = Path(out_dir)
+    with open(out_dir / "vocab.json", encoding="utf-8") as f:
+        vocab = json.load(f)
+    return TokenCorpus(
+        tokens=np.load(out_dir / f"{split_name}.tokens.npy", mmap_mode="r"),
+        offsets=np.load(out_dir / f"{split_name}.offsets.npy", mmap_mode="r"),
+        vocab=vocab,
+    )
+
+
+if __name__ == "__main__":
+    import sys
+
+    from .ep_reader import get_train_dev_eps
+
+    train, dev = get_train_dev_eps()
+    vocab = encode_splits({"train": train, "dev": dev}, sys.argv[1])
+    print(f"Encoded {len(train)} train and {len(dev)} dev plans, {len(vocab)} tokens.")
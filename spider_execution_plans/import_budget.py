@@ -0,0 +1,81 @@
+"""Checks the import time of the modules that CLI tools and workers import.
+
+Each module in `BUDGETS_MS` is imported in a fresh interpreter under
+`python -X importtime`, and the fastest of `--runs` cumulative import times is
+compared with its budget. None of them may import a module in `HEAVY_MODULES`:
+those are imported inside the functions that need them.
+
+    python -m spider_execution_plans.import_budget
+
+The budgets leave about twice the time these imports take on a laptop. Most of
+it is spent creating the `ep_types` dataclasses.
+"""
+
+import argparse
+import subprocess
+import sys
+
+from typing import Tuple
+
+HEAVY_MODULES = ("graphviz", "lxml", "numpy", "pandas", "pyodbc", "scipy")
+BUDGETS_MS = {
+    "spider_execution_plans.execution_plans.ep_types": 100,
+    "spider_execution_plans.execution_plans.ep_parser": 120,
+    "spider_execution_plans.execution_plans.ep_codec": 120,
+    "spider_execution_plans.execution_plans.ep_pickle": 120,
+    "spider_execution_plans.execution_plans.ep_corpus": 120,
+    "spider_execution_plans.execution_plans.ep_cache": 120,
+    "spider_execution_plans.execution_plans.ep_shards": 120,
+    "spider_execution_plans.execution_plans.ep_search": 120,
+    "spider_execution_plans.execution_plans.ep_scan": 120,
+    "spider_execution_plans.execution_plans.ep_synth": 150,
+    "spider_execution_plans.execution_plans.plan_to_graph": 120,
+    "spider_execution_plans.execution_plans.plan_to_text": 120,
+    "spider_execution_plans.dataset": 150,
+    "spider_execution_plans.plan_sources": 100,
+}
+
+
+def import_time(module: str) -> Tuple[float, set[str]]:
+    """The cumulative import time of `module` in milliseconds and the heavy packages it loads."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    milliseconds = 0.0
+    heavy = set()
+    # Lines look like "import time:       self |  cumulative | <indent>package".
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            milliseconds = int(cumulative) / 1000
+        package = name.strip().split(".")[0]
+        if package in HEAVY_MODULES:
+            heavy.add(package)
+    return milliseconds, heavy
+
+
+def check(runs: int = 5) -> bool:
+    ok = True
+    for module, budget in BUDGETS_MS.items():
+        times, heavy = zip(*(import_time(module) for _ in range(runs)))
+        fastest = min(times)
+        heavy = sorted(heavy[0])
+        passed = fastest <= budget and not heavy
+        ok = ok and passed
+        print(
+            f"{'ok  ' if passed else 'FAIL'} {module:<55} {fastest:>7.1f} ms / {budget} ms"
+            + (f"  imports {', '.join(heavy)}" if heavy else "")
+        )
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import-time budget.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    sys.exit(0 if check(args.runs) else 1)
@@ -0,0 +1,33 @@
+"""Manifests of per-instance content hashes, so that unchanged instances are not redone."""
+
+import hashlib
+import json
+import os
+
+from pathlib import Path
+from typing import Union
+
+
+def instance_hash(instance: dict) -> str:
+    """The SHA-256 of an instance, independent of the order of its keys."""
+    data = json.dumps(instance, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def read_manifest(path: Union[str, Path]) -> dict[int, str]:
+    """Maps the index of every instance in the manifest to its hash; empty if there is none."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {int(idx): h for idx, h in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(path: Union[str, Path], hashes: dict[int, str]) -> None:
+    # Written to a temporary file first, so a crash never leaves a torn manifest.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as f:
+        json.dump({str(idx): hashes[idx] for idx in sorted(hashes)}, f, indent=0)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,64 @@
+"""Persistent cache of execution plans keyed by the SQL sent to SQL Server."""
+
+import hashlib
+import sqlite3
+
+from typing import Optional
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """Maps the SHA-256 of a rewritten query to its showplan XML.
+
+    Every plan is committed as soon as it is stored, so a crashed harvest
+    loses at most the plan that was in flight.
+    """
+
+    def __init__(self, path: str = "plan_cache.sqlite3"):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS plans ("
+            "query_hash TEXT PRIMARY KEY, query TEXT NOT NULL, ep TEXT NOT NULL)"
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT ep FROM plans WHERE query_hash = ?", (query_hash(query),)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, query: str, ep: str) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO plans (query_hash, query, ep) VALUES (?, ?, ?)",
+            (query_hash(query), query, ep),
+        )
+        self.connection.commit()
+
+    def __contains__(self, query: str) -> bool:
+        row = self.connection.execute(
+            "SELECT 1 FROM plans WHERE query_hash = ?", (query_hash(query),)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "PlanCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
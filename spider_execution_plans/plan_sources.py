@@ -0,0 +1,218 @@
+"""Sources of SHOWPLAN XML for the dataset harvester."""
+
+import copy
+import json
+import random
+import threading
+import time
+
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Tuple, Union
+
+from .plan_cache import PlanCache
+from .plan_writer import read_records
+
+ALIAS_ERROR = "Incorrect syntax near ')'."
+
+
+def connection_string(server: str) -> str:
+    return (
+        "Driver={ODBC Driver 17 for SQL Server};"
+        f"Server={server};"
+        "Database=spider;"
+        "Trusted_Connection=yes;"
+    )
+
+
+class PlanSourceError(Exception):
+    """The source could not produce a plan for a query."""
+
+
+class TransientPlanSourceError(PlanSourceError):
+    """The plan could not be fetched, but retrying the same query may succeed."""
+
+
+def split_statements(xml: str) -> list[Tuple[str, str]]:
+    """Splits the showplan of a batch into one showplan per statement, with its text.
+
+    Each statement gets the statement id and text it would have had if it had
+    been sent on its own, without the separators of the batch.
+    """
+    from lxml import etree
+
+    from .execution_plans.ep_parser import NS
+
+    root = etree.fromstring(xml)
+    plans = []
+    for stmt in root.iterfind(f".//{{{NS}}}StmtSimple"):
+        single = etree.Element(root.tag, root.attrib, nsmap=root.nsmap)
+        parent = single
+        for tag in ("BatchSequence", "Batch", "Statements"):
+            parent = etree.SubElement(parent, f"{{{NS}}}{tag}")
+        stmt = copy.deepcopy(stmt)
+        parent.append(stmt)
+        text = stmt.get("StatementText", "").strip().rstrip(";").rstrip()
+        stmt.set("StatementText", text)
+        for name in ("StatementId", "StatementCompId"):
+            if name in stmt.attrib:
+                stmt.set(name, "1")
+        plans.append((text, etree.tostring(single, encoding="unicode")))
+    return plans
+
+
+def match_statements(plans: list[Tuple[str, str]], queries: Sequence[str]) -> list[str]:
+    """The plans of `queries`, in order, if the batch produced exactly their statements."""
+    texts = [text for text, _ in plans]
+    if texts != [query.strip() for query in queries]:
+        raise PlanSourceError(
+            f"The batch produced {len(plans)} plans that do not match its "
+            f"{len(queries)} queries."
+        )
+    return [plan for _, plan in plans]
+
+
+class PlanSource:
+    """Produces the showplan XML of a query, raising `PlanSourceError` on failure."""
+
+    def get_plan(self, query: str) -> str:
+        raise NotImplementedError
+
+    def get_plans(self, queries: Sequence[str]) -> list[str]:
+        """The plans of several queries, in one round trip where the source supports it.
+
+        Raises `PlanSourceError` if any query fails, without telling which.
+        """
+        return [self.get_plan(query) for query in queries]
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "PlanSource":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class OdbcPlanSource(PlanSource):
+    """Fetches plans from SQL Server through pyodbc with SHOWPLAN_XML on."""
+
+    def __init__(self, connection_string: str):
+        import pyodbc
+
+        self.pyodbc = pyodbc
+        self.connection = pyodbc.connect(connection_string)
+        self.cursor = self.connection.cursor()
+        self.cursor.execute("SET SHOWPLAN_XML ON")
+
+    def get_plan(self, query: str) -> str:
+        try:
+            return self.cursor.execute(query).fetchone()[0]
+        except self.pyodbc.ProgrammingError as e:
+            raise PlanSourceError(e.args[1]) from e
+        except self.pyodbc.OperationalError as e:
+            raise TransientPlanSourceError(e.args[1]) from e
+
+    def get_plans(self, queries: Sequence[str]) -> list[str]:
+        """Sends the queries as one batch and splits its showplans per statement.
+
+        The server may return one showplan for the whole batch or one per
+        statement, in one or several result sets; all of them are read.
+        """
+        documents = []
+        try:
+            self.cursor.execute(";\n".join(queries))
+            while True:
+                documents.extend(row[0] for row in self.cursor.fetchall())
+                if not self.cursor.nextset():
+                    break
+        except self.pyodbc.ProgrammingError as e:
+            raise PlanSourceError(e.args[1]) from e
+        except self.pyodbc.OperationalError as e:
+            raise TransientPlanSourceError(e.args[1]) from e
+        plans = [plan for document in documents for plan in split_statements(document)]
+        return match_statements(plans, queries)
+
+    def close(self) -> None:
+        self.cursor.close()
+        self.connection.close()
+
+
+class ReplayPlanSource(PlanSource):
+    """Serves recorded plans, with simulated round-trip latency and injected errors.
+
+    `latency` seconds plus up to `jitter` seconds are spent on every call, and
+    a fraction `error_rate` of the calls raise `TransientPlanSourceError`.
+    Queries that were recorded with the " AS T10" alias fail like they did on
+    the server, so that the harvester's alias retry is exercised.
+    """
+
+    def __init__(
+        self,
+        plans: dict[str, str],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.plans = plans
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.injected_errors = 0
+
+    @classmethod
+    def from_cache(cls, cache: PlanCache, **kwargs) -> "ReplayPlanSource":
+        plans = dict(cache.connection.execute("SELECT query, ep FROM plans"))
+        return cls(plans, **kwargs)
+
+    @classmethod
+    def from_dataset(
+        cls, paths: Iterable[Union[str, Path]], **kwargs
+    ) -> "ReplayPlanSource":
+        """Records the plans of harvested `.json` or `.jsonl` files under their statement text."""
+        from lxml import etree
+
+        from .execution_plans.ep_parser import NS
+
+        plans = {}
+        for path in map(Path, paths):
+            if path.suffix == ".jsonl":
+                instances = read_records(path)
+            else:
+                with open(path, encoding="utf-8") as f:
+                    instances = json.load(f)
+            for instance in instances:
+                stmt = etree.fromstring(instance["ep"]).find(f".//{{{NS}}}StmtSimple")
+                plans[stmt.get("StatementText")] = instance["ep"]
+        return cls(plans, **kwargs)
+
+    def _round_trip(self) -> None:
+        with self.lock:
+            self.calls += 1
+            delay = self.latency + self.random.uniform(0.0, self.jitter)
+            inject = self.random.random() < self.error_rate
+            if inject:
+                self.injected_errors += 1
+        time.sleep(delay)
+        if inject:
+            raise TransientPlanSourceError("Injected error.")
+
+    def get_plans(self, queries: Sequence[str]) -> list[str]:
+        """Serves a batch in one round trip, failing as a whole like on a server."""
+        self._round_trip()
+        return [self._plan(query) for query in queries]
+
+    def get_plan(self, query: str) -> str:
+        self._round_trip()
+        return self._plan(query)
+
+    def _plan(self, query: str) -> str:
+        if query in self.plans:
+            return self.plans[query]
+        if query + " AS T10" in self.plans:
+            raise PlanSourceError(ALIAS_ERROR)
+        raise PlanSourceError("No recorded plan for this query.")
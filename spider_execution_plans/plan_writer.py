@@ -0,0 +1,96 @@
+"""Streaming, resumable output of harvested Spider instances."""
+
+import json
+import os
+
+from pathlib import Path
+from typing import Container, Iterator, Optional, Union
+
+INDEX_KEY = "idx"
+
+
+def read_records(path: Union[str, Path]) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.endswith("\n"):
+                yield json.loads(line)
+
+
+class PlanWriter:
+    """Appends one compact JSON record per harvested instance to a JSON Lines file.
+
+    Each record is the Spider instance with its `ep` and its index in the
+    original split under `idx`. The file is flushed and fsynced every
+    `checkpoint_every` records. With `resume=True` the records of a previous
+    run are kept, a line torn by a crash is dropped, and the indices already
+    harvested are available in `harvested`.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        resume: bool = False,
+        checkpoint_every: int = 100,
+    ):
+        self.path = Path(path)
+        self.checkpoint_every = checkpoint_every
+        self.harvested: set[int] = set()
+        if resume and self.path.exists():
+            self._truncate_torn_line()
+            self.harvested = {r[INDEX_KEY] for r in read_records(self.path)}
+            self.file = open(self.path, mode="a", encoding="utf-8")
+        else:
+            self.file = open(self.path, mode="w", encoding="utf-8")
+        self.pending = 0
+
+    def _truncate_torn_line(self) -> None:
+        with open(self.path, mode="rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                f.truncate(end)
+
+    def write(self, idx: int, instance: dict) -> None:
+        record = {INDEX_KEY: idx, **instance}
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.harvested.add(idx)
+        self.pending += 1
+        if self.pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+
+    def __enter__(self) -> "PlanWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def finalize(
+    jsonl_path: Union[str, Path],
+    json_path: Union[str, Path],
+    indices: Optional[Container[int]] = None,
+) -> int:
+    """Writes the legacy pretty-printed JSON list, in split order, from a JSON Lines file.
+
+    With `indices`, such as the keys of the split manifest, the records of any
+    other index are left out.
+    """
+    records = {}
+    for record in read_records(jsonl_path):
+        idx = record.pop(INDEX_KEY)
+        if indices is None or idx in indices:
+            records[idx] = record
+    instances = [records[idx] for idx in sorted(records)]
+    with open(json_path, mode="w", encoding="utf-8") as f:
+        json.dump(instances, f, indent=2)
+    return len(instances)
@@ -1,10 +1,139 @@
+"""Provision the Spider databases in Microsoft SQL Server.
+
+The schemas are created in one batch, then the `.sql` files of each database
+are loaded with `sqlcmd`. Databases are loaded concurrently by a bounded pool
+of workers, and the files of a database are loaded one after the other, in
+dependency order.
+"""
+import argparse
+import re
 import subprocess
 import sys
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from graphlib import CycleError, TopologicalSorter
 from pathlib import Path
 
+from .schemas import create_schemas, schema_names
+
+CREATED_TABLE = re.compile(
+    r'create\s+table\s+(?:\[?\w+\]?\.)?[\["`]?(\w+)', flags=re.IGNORECASE
+)
+USED_TABLE = re.compile(
+    r'(?:references|insert\s+into)\s+(?:\[?\w+\]?\.)?[\["`]?(\w+)', flags=re.IGNORECASE
+)
+
+
+@dataclass(frozen=True)
+class LoadResult:
+    db_id: str
+    path: Path
+    returncode: int
+    output: str = ""
+
+    @property
+    def failed(self) -> bool:
+        return self.returncode != 0
+
+
+def order_by_dependencies(paths: list[Path]) -> list[Path]:
+    """Orders the files of a database so that tables are created before they are used.
+
+    Files that depend on each other in a cycle cannot be ordered; then all
+    of the files are loaded in file name order.
+    """
+    created = {}
+    used = {}
+    for path in paths:
+        sql = path.read_text(encoding="utf-8", errors="ignore")
+        created[path] = {t.lower() for t in CREATED_TABLE.findall(sql)}
+        used[path] = {t.lower() for t in USED_TABLE.findall(sql)}
+    sorter = TopologicalSorter()
+    for path in paths:
+        sorter.add(path)
+        for other in paths:
+            if other != path and used[path] & created[other]:
+                sorter.add(path, other)
+    try:
+        sorter.prepare()
+    except CycleError as e:
+        cycle = " -> ".join(p.name for p in e.args[1])
+        db_id = paths[0].parent.name
+        print(f"{db_id}: files depend on each other ({cycle}), loading them in name order")
+        return sorted(paths)
+    ordered = []
+    while sorter.is_active():
+        ready = sorted(sorter.get_ready())
+        ordered.extend(ready)
+        sorter.done(*ready)
+    return ordered
+
+
+def load_database(server: str, db_id: str, paths: list[Path]) -> list[LoadResult]:
+    """Loads the files in order, skipping the rest once one of them fails."""
+    results = []
+    for i, path in enumerate(paths):
+        completed = subprocess.run(
+            args=["sqlcmd", "-S", server, "-b", "-i", str(path)],
+            capture_output=True,
+            text=True,
+        )
+        results.append(
+            LoadResult(db_id, path, completed.returncode, completed.stdout + completed.stderr)
+        )
+        if completed.returncode != 0:
+            results.extend(
+                LoadResult(db_id, p, -1, "Skipped after a previous file failed.")
+                for p in paths[i + 1 :]
+            )
+            break
+    return results
+
+
+def populate(server: str, schema_dir: Path, workers: int) -> list[LoadResult]:
+    databases = {}
+    for db_id in schema_names(schema_dir):
+        paths = sorted((schema_dir / db_id).glob("*.sql"))
+        if paths:
+            databases[db_id] = order_by_dependencies(paths)
+    total = sum(map(len, databases.values()))
+    done = 0
+    failures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(load_database, server, db_id, paths)
+            for db_id, paths in databases.items()
+        ]
+        for future in as_completed(futures):
+            for result in future.result():
+                done += 1
+                status = "FAILED" if result.failed else "ok"
+                print(f"[{done}/{total}] {result.db_id}/{result.path.name}: {status}")
+                if result.failed:
+                    failures.append(result)
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("server", help="SQL Server instance to connect to")
+    parser.add_argument("--schemas", type=Path, default=Path("schemas"))
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--skip-create", action="store_true", help="assume the schemas already exist"
+    )
+    args = parser.parse_args()
+
+    if not args.skip_create:
+        create_schemas(args.server, schema_names(args.schemas))
+    failures = populate(args.server, args.schemas, args.workers)
+    for failure in failures:
+        print(f"{failure.db_id}/{failure.path.name} ({failure.returncode}):")
+        print(failure.output.strip())
+    print(f"{len(failures)} files failed.")
+    sys.exit(1 if failures else 0)
 
-sqls = Path("schemas").glob("*/*.sql")
 
-for sql in sqls:
-    subprocess.run(args=["sqlcmd", "-S", sys.argv[1], "-i", str(sql)])
+if __name__ == "__main__":
+    main()
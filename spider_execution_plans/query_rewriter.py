@@ -0,0 +1,219 @@
+"""Rewrite Spider queries into SQL Server queries."""
+
+import argparse
+import json
+import re
+import sys
+
+from pathlib import Path
+from typing import Iterator, Tuple
+
+AGGREGATES = ("sum", "avg", "count", "min", "max")
+AFTER_FROM_KEYWORDS = frozenset(["where", "order", "group"])
+QUOTES = frozenset(["``", "''"])
+SPACED_STRING = re.compile(r"' ([^']+) '")
+DOUBLE_QUOTED_STRING = re.compile(r'"([^"]+)"')
+
+Tokens = Tuple[list[str], list[str]]
+
+
+class QueryRewriter:
+    """Rewrites the `query_toks` of Spider instances into SQL Server queries.
+
+    Every stage works on the tokens together with their lowercase forms, which
+    are computed once per query, and the table names of each database are
+    kept in a set.
+    """
+
+    def __init__(self, tables: dict):
+        self.table_names = {
+            db_id: frozenset(t.lower() for t in table["table_names_original"])
+            for db_id, table in tables.items()
+        }
+
+    def rewrite(self, instance: dict) -> str:
+        db_id = instance["db_id"]
+        tokens = instance["query_toks"]
+        lowered = [t.lower() for t in tokens]
+        lowercase_query = instance["query"].lower()
+
+        if "group by" in lowercase_query:
+            tokens, lowered = copy_columns_from_select_to_groupby(tokens, lowered)
+        if "select distinct" in lowercase_query and "order by" in lowercase_query:
+            tokens, lowered = copy_orderby_to_select_distinct(tokens, lowered)
+        if "limit" in lowercase_query:
+            tokens, lowered = convert_limit_to_top(tokens, lowered)
+
+        new_query = " ".join(
+            add_schema_name_to_tables(db_id, tokens, lowered, self.table_names[db_id])
+        )
+        new_query = SPACED_STRING.sub(r"'\1'", new_query)
+        return DOUBLE_QUOTED_STRING.sub(r"'\1'", new_query)
+
+
+def copy_columns_from_select_to_groupby(tokens: list[str], lowered: list[str]) -> Tokens:
+    new_tokens = []
+    new_lowered = []
+    i = 0
+    while i < len(tokens):
+        lower = lowered[i]
+        if lower == "select":
+            if lowered[i + 1] == "distinct":
+                select_idx = i + 1
+                new_tokens.extend(tokens[i : i + 2])
+                new_lowered.extend(lowered[i : i + 2])
+                i += 2
+            else:
+                select_idx = i
+                new_tokens.append(tokens[i])
+                new_lowered.append(lower)
+                i += 1
+        elif lower == "from":
+            select_args = []
+            select_lowered = []
+            for j in range(select_idx + 1, i):
+                if tokens[j] != ",":
+                    select_args.append(tokens[j])
+                    select_lowered.append(lowered[j])
+            for agg in AGGREGATES:
+                while agg in select_lowered:
+                    idx = select_lowered.index(agg)
+                    end = select_lowered.index(")", idx) + 1
+                    del select_args[idx:end]
+                    del select_lowered[idx:end]
+            new_tokens.append(tokens[i])
+            new_lowered.append(lower)
+            i += 1
+        elif lower == "group" and lowered[i + 1] == "by":
+            groupby_arg = tokens[i + 2]
+            if groupby_arg not in select_args:
+                select_args.append(groupby_arg)
+            columns = " , ".join(select_args).split()
+            new_tokens.extend(tokens[i : i + 2])
+            new_tokens.extend(columns)
+            new_lowered.extend(lowered[i : i + 2])
+            new_lowered.extend(t.lower() for t in columns)
+            i += 3
+        else:
+            new_tokens.append(tokens[i])
+            new_lowered.append(lower)
+            i += 1
+    return new_tokens, new_lowered
+
+
+def copy_orderby_to_select_distinct(tokens: list[str], lowered: list[str]) -> Tokens:
+    order_idx = lowered.index("order")
+    for i in range(order_idx, -1, -1):
+        if lowered[i] == "distinct":
+            distinct_idx = i
+            break
+    from_idx = lowered.index("from")
+    if lowered[order_idx + 2] in AGGREGATES:
+        end = lowered.index(")", order_idx + 2)
+        inserted = tokens[order_idx + 2 : end] + [","]
+        inserted_lowered = lowered[order_idx + 2 : end] + [","]
+    else:
+        orderby_arg = tokens[order_idx + 2]
+        if orderby_arg in tokens[distinct_idx + 1 : from_idx]:
+            return tokens, lowered
+        inserted = [orderby_arg, ","]
+        inserted_lowered = [lowered[order_idx + 2], ","]
+    at = distinct_idx + 1
+    return (
+        tokens[:at] + inserted + tokens[at:],
+        lowered[:at] + inserted_lowered + lowered[at:],
+    )
+
+
+def convert_limit_to_top(tokens: list[str], lowered: list[str]) -> Tokens:
+    tokens = list(tokens)
+    lowered = list(lowered)
+    while "limit" in lowered:
+        limit_idx = lowered.index("limit")
+        limit_arg = lowered[limit_idx + 1]
+        for i in range(limit_idx, -1, -1):
+            if lowered[i] == "select":
+                select_idx = i
+                break
+        # The position of DISTINCT is looked up before the LIMIT is removed.
+        if "distinct" in lowered[select_idx:]:
+            at = lowered.index("distinct") + 1
+        else:
+            at = select_idx + 1
+        del tokens[limit_idx : limit_idx + 2]
+        del lowered[limit_idx : limit_idx + 2]
+        tokens[at:at] = ["TOP", limit_arg]
+        lowered[at:at] = ["top", limit_arg]
+    return tokens, lowered
+
+
+def add_schema_name_to_tables(
+    db_id: str, tokens: list[str], lowered: list[str], table_names: frozenset
+) -> list[str]:
+    new_tokens = []
+    is_from = False
+    for token, lower in zip(tokens, lowered):
+        if token in QUOTES:
+            token = lower = "'"
+        if lower == "from":
+            is_from = True
+        if is_from and lower in table_names:
+            new_tokens.append(f"{db_id}.{token}")
+        else:
+            new_tokens.append(token)
+        if lower in AFTER_FROM_KEYWORDS:
+            is_from = False
+    return new_tokens
+
+
+def golden_pairs(spider: list, harvested: list) -> Iterator[Tuple[dict, str]]:
+    """Aligns the original Spider instances with the harvested instances of the same split."""
+    from lxml import etree
+
+    from .execution_plans.ep_parser import NS
+
+    j = 0
+    for instance in spider:
+        if j == len(harvested):
+            break
+        ins = harvested[j]
+        if (ins["db_id"], ins["question"], ins["query"]) != (
+            instance["db_id"],
+            instance["question"],
+            instance["query"],
+        ):
+            continue
+        j += 1
+        stmt = etree.fromstring(ins["ep"]).find(f".//{{{NS}}}StmtSimple")
+        yield instance, stmt.get("StatementText")
+
+
+def check_golden(spider_path: Path, dataset_path: Path) -> int:
+    """Compares the rewritten Spider queries with the statements of the harvested plans."""
+    with open(spider_path / "tables.json", encoding="utf-8") as f:
+        rewriter = QueryRewriter({table["db_id"]: table for table in json.load(f)})
+    mismatches = 0
+    for split_name, file_name in (("train", "train_spider.json"), ("dev", "dev.json")):
+        with open(spider_path / file_name, encoding="utf-8") as f:
+            spider = json.load(f)
+        with open(dataset_path / f"{split_name}_spider_with_ep.json", encoding="utf-8") as f:
+            harvested = json.load(f)
+        checked = 0
+        for instance, statement in golden_pairs(spider, harvested):
+            new_query = rewriter.rewrite(instance)
+            # Queries that needed the alias hack were sent with " AS T10" appended.
+            if statement not in (new_query, new_query + " AS T10"):
+                mismatches += 1
+                print(f"{instance['db_id']}:\n  rewritten: {new_query}\n  golden:    {statement}")
+            checked += 1
+        print(f"{split_name}: checked {checked} queries")
+    print(f"{mismatches} mismatches")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=check_golden.__doc__)
+    parser.add_argument("spider", type=Path, help="directory with the original Spider files")
+    parser.add_argument("--dataset", type=Path, default=Path("dataset"))
+    args = parser.parse_args()
+    sys.exit(1 if check_golden(args.spider, args.dataset) else 0)
@@ -2,17 +2,36 @@
 import sys
 
 from pathlib import Path
+from typing import Iterable
 
-import pyodbc
+from .plan_sources import connection_string
 
-CONNECTION_STRING = f"Driver={{ODBC Driver 17 for SQL Server}};Server={sys.argv[1]};Database=spider;Trusted_Connection=yes;"
 
-SCHEMA_PATHS = Path(sys.argv[2]).glob("*")
+def schema_names(schema_dir: Path) -> list[str]:
+    return sorted(
+        p.name for p in schema_dir.glob("*") if p.is_dir() and not p.name.startswith(".")
+    )
 
-if __name__ == "__main__":
-    conn = pyodbc.connect(CONNECTION_STRING, autocommit=True)
+
+def create_schemas_batch(names: Iterable[str]) -> str:
+    # CREATE SCHEMA must be the only statement in its batch, so each one is
+    # wrapped in EXEC. Existing schemas are skipped to make reruns harmless.
+    return "\n".join(
+        f"IF SCHEMA_ID(N'{name}') IS NULL EXEC(N'CREATE SCHEMA [{name}]');"
+        for name in names
+    )
+
+
+def create_schemas(server: str, names: Iterable[str]) -> None:
+    """Creates every schema in a single round trip."""
+    import pyodbc
+
+    conn = pyodbc.connect(connection_string(server), autocommit=True)
     cursor = conn.cursor()
-    for p in SCHEMA_PATHS:
-        cursor.execute(f"CREATE SCHEMA {p.name}")
+    cursor.execute(create_schemas_batch(names))
     cursor.close()
     conn.close()
+
+
+if __name__ == "__main__":
+    create_schemas(sys.argv[1], schema_names(Path(sys.argv[2])))
@@ -0,0 +1,85 @@
+import json
+
+from spider_execution_plans.dataset import add_execution_plan
+from spider_execution_plans.manifest import instance_hash
+from spider_execution_plans.plan_cache import PlanCache
+from spider_execution_plans.plan_sources import ReplayPlanSource
+from spider_execution_plans.plan_writer import PlanWriter, finalize
+
+
+class IdentityRewriter:
+    def rewrite(self, instance: dict) -> str:
+        return instance["query"]
+
+
+def make_split(n: int, databases: int = 2) -> list[dict]:
+    return [
+        {"db_id": f"db{i % databases}", "query": f"SELECT {i}", "question": f"q{i}"}
+        for i in range(n)
+    ]
+
+
+def make_source(split: list[dict], **kwargs) -> ReplayPlanSource:
+    plans = {ins["query"]: f"<plan>{ins['query']}</plan>" for ins in split}
+    return ReplayPlanSource(plans, **kwargs)
+
+
+def harvest(tmp_path, split, source, manifest, resume=True, **kwargs) -> list:
+    with PlanCache(str(tmp_path / "cache.sqlite3")) as cache:
+        with PlanWriter(tmp_path / "split.jsonl", resume) as writer:
+            return add_execution_plan(
+                split, IdentityRewriter(), [source], cache, writer, manifest, **kwargs
+            )
+
+
+def finalized(tmp_path, manifest) -> list[dict]:
+    finalize(tmp_path / "split.jsonl", tmp_path / "split.json", manifest)
+    with open(tmp_path / "split.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_resume_after_a_crash_keeps_the_instances_harvested_before_it(tmp_path):
+    split = make_split(10)
+    source = make_source(split)
+    # The first run is killed after 6 instances, before its manifest is written.
+    harvest(tmp_path, split[:6], source, {}, resume=False)
+    manifest = {}
+    assert harvest(tmp_path, split, source, manifest) == []
+    assert manifest == {idx: instance_hash(ins) for idx, ins in enumerate(split)}
+    assert [ins["query"] for ins in finalized(tmp_path, manifest)] == [
+        ins["query"] for ins in split
+    ]
+    assert source.calls == 10
+
+
+def test_resume_harvests_again_a_record_that_no_longer_matches(tmp_path):
+    split = make_split(4)
+    harvest(tmp_path, split, make_source(split), {}, resume=False)
+    split[2] = {**split[2], "question": "changed"}
+    manifest = {}
+    harvest(tmp_path, split, make_source(split), manifest)
+    assert finalized(tmp_path, manifest)[2]["question"] == "changed"
+
+
+def test_a_failed_query_is_not_sent_again_for_later_databases(tmp_path):
+    split = make_split(60, databases=30)
+    for ins in split[::2]:
+        ins["query"] = "SELECT missing"
+    source = make_source(split[1::2], latency=0.01)
+    manifest = {}
+    errors = harvest(tmp_path, split, source, manifest, resume=False)
+    assert [row["db_id"] for row in errors] == [ins["db_id"] for ins in split[::2]]
+    assert {str(row["error"]) for row in errors} == {"No recorded plan for this query."}
+    assert sorted(manifest) == list(range(1, 60, 2))
+    assert source.calls < 60
+
+
+def test_repeated_queries_are_counted_per_database(tmp_path):
+    split = make_split(6, databases=1)
+    for ins in split[3:]:
+        ins["query"] = "SELECT 0"
+    source = make_source(split)
+    timings = {}
+    harvest(tmp_path, split, source, {}, resume=False, timings=timings)
+    assert (timings["db0"].instances, timings["db0"].duplicates) == (6, 3)
+    assert timings["db0"].queries == source.calls == 3